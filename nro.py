@@ -4,6 +4,7 @@ from ctypes import *
 
 NROHEADERMAGIC = b"NRO0"
 ASSETHEADERMAGIC = b"ASET"
+MOD0HEADERMAGIC = b"MOD0"
 
 
 class NRO(LittleEndianStructure):
@@ -50,6 +51,23 @@ class NRO(LittleEndianStructure):
     ]
 
 
+class MOD0(LittleEndianStructure):
+    """https://switchbrew.org/wiki/NSO#MOD
+
+    All offsets are relative to the start of the MOD0 header.
+    """
+    _pack_ = 1
+    _fields_ = [
+        ("magic", ARRAY(c_char, 4)),
+        ("dynamicOffset", c_int32),
+        ("bssStartOffset", c_int32),
+        ("bssEndOffset", c_int32),
+        ("ehFrameHdrStartOffset", c_int32),
+        ("ehFrameHdrEndOffset", c_int32),
+        ("moduleObjectOffset", c_int32)
+    ]
+
+
 class Asset(LittleEndianStructure):
     """https://switchbrew.org/w/index.php?title=NRO#Assets"""
 
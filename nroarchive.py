@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+
+import argparse
+import sys
+import tarfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from nro import *
+from nrohelper import NoAssetsError
+from nroscan import fill_record, new_record, write_jsonl
+
+SKIP_CHUNK_SIZE = 1024 * 1024
+
+
+class NROStream:
+    """Read-only NRO parser for forward-only streams, e.g. archive members or pipes.
+
+    The stream is consumed front to back exactly once: NRO header, asset header, icon and
+    NACP are read, everything in between and the RomFS is skipped without buffering it.
+
+    Args:
+        stream (file): Readable stream positioned at the start of the NRO
+        read_icon (bool): Keep the icon bytes, otherwise the icon is skipped (Default: True)
+    """
+
+    def __init__(self, stream, read_icon=True):
+        self.stream = stream
+        self.position = 0
+        self.icon = None
+        self.nacp = None
+
+        self.nro = NRO.from_buffer_copy(self._read_exactly(sizeof(NRO)))
+        if self.nro.header.magic != NROHEADERMAGIC:
+            raise Exception("Header magic is wrong, should be 'NRO0'")
+
+        self._skip_to(self.nro.header.size)
+        try:
+            self.asset = Asset.from_buffer_copy(self._read_exactly(sizeof(Asset)))
+        except EOFError:
+            raise NoAssetsError()
+        if self.asset.magic != ASSETHEADERMAGIC:
+            raise Exception("Asset header magic is wrong, should be 'ASET'")
+
+        wanted = [("nacp", self.asset.nacp)]
+        if read_icon:
+            wanted.append(("icon", self.asset.icon))
+        # Sections have to be visited in file order on a forward-only stream
+        for name, section in sorted(wanted, key=lambda item: item[1].offset):
+            if section.size == 0:
+                continue
+            self._skip_to(self.nro.header.size + section.offset)
+            data = self._read_exactly(section.size)
+            if name == "nacp":
+                self.nacp = NACP.from_buffer_copy(data)
+            else:
+                self.icon = data
+
+    def _read_exactly(self, size):
+        chunks = []
+        remaining = size
+        while remaining > 0:
+            chunk = self.stream.read(remaining)
+            if not chunk:
+                raise EOFError("Unexpected end of stream")
+            chunks.append(chunk)
+            remaining -= len(chunk)
+        self.position += size
+        return b"".join(chunks)
+
+    def _skip_to(self, offset):
+        if offset < self.position:
+            raise ValueError("Overlapping sections can't be read from a forward-only stream")
+        remaining = offset - self.position
+        while remaining > 0:
+            chunk = self.stream.read(min(remaining, SKIP_CHUNK_SIZE))
+            if not chunk:
+                raise EOFError("Unexpected end of stream")
+            remaining -= len(chunk)
+        self.position = offset
+
+    def get_name(self):
+        """Returns first language entry name."""
+        return self.nacp.title[0].get_name()
+
+    def get_publisher(self):
+        """Returns first language entry publisher."""
+        return self.nacp.title[0].get_publisher()
+
+
+def read_stream_metadata(stream, path):
+    """Returns the catalog record (see nroscan) of an NRO read from a forward-only stream."""
+    record = new_record(path)
+    try:
+        nro = NROStream(stream, read_icon=False)
+        fill_record(record, nro.nro, nro.asset, nro.nacp)
+    except Exception as e:
+        record["error"] = str(e)
+    return record
+
+
+def scan_archive(path, extension=".nro"):
+    """Yields catalog records of all NROs in a zip or tar archive without unpacking it.
+
+    Members are streamed, the "path" of a record is "<archive>/<member>" and file_size is
+    the uncompressed member size.
+
+    Args:
+        path (str): Path to a .zip or .tar(.gz/.bz2/.xz) archive
+        extension (str): File extension of members to parse (Default: ".nro")
+    """
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or not info.filename.lower().endswith(extension):
+                    continue
+                with archive.open(info) as stream:
+                    record = read_stream_metadata(stream, path + "/" + info.filename)
+                record["file_size"] = info.file_size
+                yield record
+    else:
+        # Stream mode reads the (compressed) archive strictly front to back
+        with tarfile.open(path, "r|*") as archive:
+            for member in archive:
+                if not member.isfile() or not member.name.lower().endswith(extension):
+                    continue
+                record = read_stream_metadata(
+                    archive.extractfile(member), path + "/" + member.name
+                )
+                record["file_size"] = member.size
+                yield record
+
+
+def _scan_archive_list(path):
+    try:
+        return list(scan_archive(path))
+    except (OSError, tarfile.TarError, zipfile.BadZipFile) as e:
+        record = new_record(path)
+        record["error"] = str(e)
+        return [record]
+
+
+def scan_archives(paths, workers=None):
+    """Scans many archives in a process pool and yields all catalog records.
+
+    Args:
+        paths (iterable): Archive paths
+        workers (int): Number of worker processes (Default: CPU count)
+    """
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for records in executor.map(_scan_archive_list, paths):
+            yield from records
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Read NRO metadata straight from zip/tar archives without unpacking them."
+    )
+    parser.add_argument("archives", nargs="+", help="Archive files")
+    parser.add_argument("--workers", type=int, help="Number of worker processes")
+    args = parser.parse_args(argv)
+
+    write_jsonl(scan_archives(args.archives, args.workers), sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
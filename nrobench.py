@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from nro import *
+from romfs import RomFSBuilder
+
+WRITE_CHUNK_SIZE = 4 * 1024 * 1024
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+# Relative slowdown in wall time at which a case counts as regression
+REGRESSION_THRESHOLD = 0.10
+# Maximum wall time of one `nrohelper_cli.py probe` invocation, including interpreter startup
+STARTUP_BUDGET = 0.15
+CLI_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "nrohelper_cli.py")
+
+
+def parse_size(value):
+    """Parses sizes like "512", "64K", "16M" or "1G"."""
+    value = value.strip().upper().rstrip("B")
+    unit = value[-1:] if value[-1:] in SIZE_UNITS else ""
+    return int(float(value[:len(value) - len(unit)]) * SIZE_UNITS[unit])
+
+
+def _write_filler(fp, size, chunk):
+    while size > 0:
+        fp.write(chunk[:size])
+        size -= min(size, len(chunk))
+
+
+def make_nro(path, text_size=0x10000, ro_size=0x8000, data_size=0x4000, icon_size=0x4000,
+             romfs_size=0x100000, name="Benchmark", publisher="NROHelper", version="1.0.0"):
+    """Writes a synthetic NRO with assets, streaming the segment and RomFS contents.
+
+    Segment contents are incompressible filler and the icon is only a JPEG-framed placeholder,
+    which is enough for everything except decoding it. The RomFS is a valid image built with
+    romfs.RomFSBuilder holding a single file of filler, so its size is rounded down to whole
+    words and never gets smaller than its header and tables.
+
+    Args:
+        path (str): Output path
+        text_size (int): Size of the text segment, including the NRO header
+        ro_size (int): Size of the ro segment
+        data_size (int): Size of the data segment
+        icon_size (int): Size of the icon
+        romfs_size (int): Size of the RomFS
+        name (str): Name in all NACP title entries
+        publisher (str): Publisher in all NACP title entries
+        version (str): NACP display version
+    """
+    text_size = max(text_size, sizeof(NRO))
+    chunk = os.urandom(min(WRITE_CHUNK_SIZE, max(text_size, ro_size, data_size, romfs_size)))
+
+    nro = NRO()
+    nro.header.magic = NROHEADERMAGIC
+    offset = 0
+    for segment, size in zip(nro.header.segmentHeader, (text_size, ro_size, data_size)):
+        segment.offset = offset
+        segment.size = size
+        offset += size
+    nro.header.size = offset
+
+    nacp = NACP()
+    for entry in nacp.title:
+        entry.name[:len(name.encode())] = list(name.encode())
+        entry.publisher[:len(publisher.encode())] = list(publisher.encode())
+    nacp.displayVersion[:len(version.encode())] = list(version.encode())
+
+    asset = Asset()
+    asset.magic = ASSETHEADERMAGIC
+    asset.icon.offset = sizeof(Asset)
+    asset.icon.size = icon_size
+    asset.nacp.offset = asset.icon.offset + icon_size
+    asset.nacp.size = sizeof(NACP)
+    asset.romfs.offset = asset.nacp.offset + sizeof(NACP)
+
+    with tempfile.TemporaryDirectory() as romfs_dir, open(path, "wb") as nro_file:
+        filler_path = os.path.join(romfs_dir, "filler.bin")
+        open(filler_path, "wb").close()
+        # Header and tables don't depend on the file size, only the data does
+        filler_size = max(romfs_size - RomFSBuilder(romfs_dir).size, 0) & ~3
+        with open(filler_path, "wb") as filler_file:
+            _write_filler(filler_file, filler_size, chunk)
+        romfs = RomFSBuilder(romfs_dir)
+        asset.romfs.size = romfs.size
+
+        nro_file.write(bytes(nro))
+        _write_filler(nro_file, nro.header.size - sizeof(NRO), chunk)
+        nro_file.write(bytes(asset))
+        if icon_size:
+            icon = b"\xff\xd8" + b"\x00" * max(icon_size - 4, 0) + b"\xff\xd9"
+            nro_file.write(icon[:icon_size])
+        nro_file.write(bytes(nacp))
+        romfs.write(nro_file)
+
+
+def _peak_rss():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _bytes_read():
+    try:
+        with open("/proc/self/io") as io_file:
+            for line in io_file:
+                if line.startswith("rchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+
+
+def bench_open(path):
+    from nrohelper import NROHelper
+    NROHelper(path).close()
+
+
+def bench_open_lazy(path):
+    from nrohelper import NROHelper
+    nro = NROHelper(path, lazy=True)
+    nro.get_name()
+    nro.close()
+
+
+def bench_probe(path):
+    from nrohelper import probe
+    probe(path)
+
+
+def bench_extract(path, section):
+    from nrohelper import NROHelper
+    nro = NROHelper(path, lazy=True)
+    with tempfile.TemporaryFile() as out_file:
+        getattr(nro, "extract_" + section)(out_file)
+    nro.close()
+
+
+def bench_edit(path):
+    from nrohelper import NROHelper
+    nro = NROHelper(path, lazy=True)
+    nro.edit_name("Benchmark (edited)")
+    nro.edit_version("2.0.0")
+    nro.save_nacp()
+    nro.close()
+
+
+def bench_scan(directory):
+    import nroscan
+    for _ in nroscan.scan(directory):
+        pass
+
+
+def bench_cli_startup(path):
+    subprocess.run([sys.executable, CLI_PATH, "probe", path], check=True, stdout=subprocess.DEVNULL)
+
+
+CASES = {
+    "open": lambda env: bench_open(env["nro"]),
+    "open_lazy": lambda env: bench_open_lazy(env["nro"]),
+    "probe": lambda env: bench_probe(env["nro"]),
+    "extract_icon": lambda env: bench_extract(env["nro"], "icon"),
+    "extract_nacp": lambda env: bench_extract(env["nro"], "nacp"),
+    "extract_romfs": lambda env: bench_extract(env["nro"], "romfs"),
+    "edit_save": lambda env: bench_edit(env["nro"]),
+    "scan": lambda env: bench_scan(env["library"]),
+    "cli_startup": lambda env: bench_cli_startup(env["nro"]),
+}
+# Cases with an absolute wall time budget, checked on every run
+BUDGETS = {"cli_startup": STARTUP_BUDGET}
+
+
+def _measure(case, env):
+    """Runs a case in the current (fresh) process and returns its measurements."""
+    # Import up front so module loading doesn't show up in the measurements
+    import nrohelper
+    import nroscan
+
+    rss_before = _peak_rss()
+    read_before = _bytes_read()
+    start = time.perf_counter()
+    CASES[case](env)
+    wall = time.perf_counter() - start
+    read_after = _bytes_read()
+    return {
+        "wall": wall,
+        "peak_rss": _peak_rss(),
+        "peak_rss_delta": None if rss_before is None else _peak_rss() - rss_before,
+        "bytes_read": None if read_before is None else read_after - read_before,
+    }
+
+
+def _measure_child(case, env, connection):
+    connection.send(_measure(case, env))
+    connection.close()
+
+
+def run_case(case, env, repeat=3):
+    """Runs a case repeat times, each in a fresh process, and keeps the fastest run."""
+    # Not a Pool: its daemonic workers could not start the scanner's own process pool
+    context = multiprocessing.get_context("spawn")
+    runs = []
+    for _ in range(repeat):
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=_measure_child, args=(case, env, sender))
+        process.start()
+        sender.close()
+        try:
+            runs.append(receiver.recv())
+        except EOFError:
+            raise RuntimeError("Benchmark case '{0}' failed".format(case))
+        finally:
+            process.join()
+    return min(runs, key=lambda run: run["wall"])
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """Returns the names of all cases which got slower than baseline by more than threshold."""
+    regressions = []
+    for case, result in results.items():
+        base = baseline.get(case)
+        if base and result["wall"] > base["wall"] * (1 + threshold):
+            regressions.append(case)
+    return regressions
+
+
+def over_budget(results, budgets=BUDGETS):
+    """Returns the names of all cases exceeding their absolute wall time budget."""
+    return [
+        case for case, result in results.items()
+        if case in budgets and result["wall"] > budgets[case]
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark NROHelper on synthetic NROs.")
+    parser.add_argument("--text-size", type=parse_size, default="64K")
+    parser.add_argument("--ro-size", type=parse_size, default="32K")
+    parser.add_argument("--data-size", type=parse_size, default="16K")
+    parser.add_argument("--icon-size", type=parse_size, default="16K")
+    parser.add_argument("--romfs-size", type=parse_size, default="64M")
+    parser.add_argument("--files", type=int, default=1000, help="Library size for 'scan'")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case, fastest is kept")
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--baseline", help="Earlier results to check for regressions")
+    parser.add_argument("--workdir", help="Directory for generated files (Default: temporary)")
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="nrobench-")
+    os.makedirs(workdir, exist_ok=True)
+    sizes = {
+        "text_size": args.text_size,
+        "ro_size": args.ro_size,
+        "data_size": args.data_size,
+        "icon_size": args.icon_size,
+        "romfs_size": args.romfs_size,
+    }
+    try:
+        env = {
+            "nro": os.path.join(workdir, "bench.nro"),
+            "library": os.path.join(workdir, "library"),
+        }
+        make_nro(env["nro"], **sizes)
+        if "scan" in args.cases:
+            os.makedirs(env["library"], exist_ok=True)
+            # Scans only touch headers, small RomFS sections keep the library cheap to generate
+            for i in range(args.files):
+                make_nro(
+                    os.path.join(env["library"], "{0:06d}.nro".format(i)),
+                    **dict(sizes, romfs_size=min(args.romfs_size, 0x10000))
+                )
+
+        results = {}
+        for case in args.cases:
+            results[case] = run_case(case, env, args.repeat)
+            print("{0:<14} {1:9.4f}s".format(case, results[case]["wall"]), file=sys.stderr)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {"config": dict(sizes, files=args.files, repeat=args.repeat), "results": results}
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    failed = False
+    for case in over_budget(results):
+        print("Over budget: {0} ({1:.4f}s > {2:.4f}s)".format(
+            case, results[case]["wall"], BUDGETS[case]
+        ), file=sys.stderr)
+        failed = True
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file)["results"])
+        for case in regressions:
+            print("Regression: {0}".format(case), file=sys.stderr)
+        failed = failed or bool(regressions)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
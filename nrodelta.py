@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+
+import argparse
+import hashlib
+import os
+import zlib
+
+from nro import *
+from nrohelper import (
+    ASSET_NAMES, SEGMENT_NAMES, NROValidationError, atomic_write, copy_range, file_size,
+    hash_range, pread, read_headers, validate_layout,
+)
+
+DELTAMAGIC = b"NROD"
+DELTA_VERSION = 1
+DEFAULT_BLOCK_SIZE = 16 * 1024
+# Upper bound of a single DATA op, keeps memory bounded while diffing and patching
+MAX_DATA_SIZE = 1024 * 1024
+BLOCK_DIGEST_SIZE = 16
+# Modulus of the Adler-32 weak hash
+ADLER_MOD = 65521
+
+OP_COPY = 0
+OP_DATA = 1
+
+
+class DeltaHeader(LittleEndianStructure):
+    """Header of a patch file, followed by the zlib-compressed op stream."""
+    _pack_ = 1
+    _fields_ = [
+        ("magic", ARRAY(c_char, 4)),
+        ("version", c_uint32),
+        ("blockSize", c_uint32),
+        ("reserved", c_uint32),
+        ("sourceSize", c_uint64),
+        ("targetSize", c_uint64),
+        ("sourceHash", ARRAY(c_ubyte, 32)),
+        ("targetHash", ARRAY(c_ubyte, 32)),
+    ]
+
+
+class DeltaOp(LittleEndianStructure):
+    """COPY: size bytes from offset in the source. DATA: size literal bytes follow."""
+    _pack_ = 1
+    _fields_ = [
+        ("type", c_uint8),
+        ("offset", c_uint64),
+        ("size", c_uint64),
+    ]
+
+
+def read_regions(fp):
+    """Splits an NRO into named, non-overlapping regions covering the whole file.
+
+    Regions are the segments, the asset header and the asset sections. Bytes in between
+    become "<previous region>+" regions, so they are matched between versions as well.
+
+    Returns a list of (name, start, end) sorted by start.
+
+    Args:
+        fp (file): NRO file object
+    """
+    size = file_size(fp)
+    nro, asset = read_headers(fp)
+    problems = validate_layout(nro, asset, size)
+    if problems:
+        raise NROValidationError(problems)
+
+    named = [
+        (name, segment.offset, segment.offset + segment.size)
+        for name, segment in zip(SEGMENT_NAMES, nro.header.segmentHeader)
+    ]
+    if asset is not None:
+        named.append(("asset header", nro.header.size, nro.header.size + sizeof(Asset)))
+        for name in ASSET_NAMES:
+            section = getattr(asset, name)
+            start = nro.header.size + section.offset
+            named.append((name, start, start + section.size))
+
+    regions = []
+    position = 0
+    previous = "start"
+    for name, start, end in sorted((r for r in named if r[2] > r[1]), key=lambda r: r[1]):
+        if start > position:
+            regions.append((previous + "+", position, start))
+        regions.append((name, start, end))
+        position = end
+        previous = name
+    if size > position:
+        regions.append((previous + "+", position, size))
+    return regions
+
+
+def _block_digest(data):
+    return hashlib.blake2b(data, digest_size=BLOCK_DIGEST_SIZE).digest()
+
+
+def _index_region(fp, start, end, block_size):
+    """Returns Adler-32 -> {block digest: source offset} for all full blocks of a region."""
+    index = {}
+    for offset in range(start, end - block_size + 1, block_size):
+        data = pread(fp, block_size, offset)
+        index.setdefault(zlib.adler32(data), {}).setdefault(_block_digest(data), offset)
+    return index
+
+
+def _diff_region(fp, start, end, index, block_size, writer):
+    """Matches a target region against a source index (rsync style) and writes its ops.
+
+    The Adler-32 of the block at the current position is looked up in the index. On a miss
+    the window rolls on by one byte, so blocks are found at any offset, e.g. behind inserted
+    or removed bytes. Unchanged data costs one zlib.adler32 and one digest per block, only
+    changed data goes through the (slower) byte-wise roll.
+
+    Returns the number of copied bytes.
+    """
+    copied = 0
+    # buffer holds the target from buffer_start on, at least up to the end of the window
+    buffer = b""
+    buffer_start = start
+    literal = position = start
+    weak = None
+    while True:
+        window_end = position + block_size
+        if window_end > end:
+            break
+        if window_end > buffer_start + len(buffer):
+            # Keep the pending literal and the byte the roll removes next
+            keep = literal if weak is None else min(literal, position - 1)
+            read_size = min(end, window_end + MAX_DATA_SIZE) - (buffer_start + len(buffer))
+            buffer = buffer[keep - buffer_start:] + pread(
+                fp, read_size, buffer_start + len(buffer)
+            )
+            buffer_start = keep
+        i = position - buffer_start
+
+        if weak is None:
+            weak = zlib.adler32(buffer[i:i + block_size])
+        else:
+            # Roll the window by one byte
+            removed = buffer[i - 1]
+            a = ((weak & 0xFFFF) - removed + buffer[i + block_size - 1]) % ADLER_MOD
+            b = ((weak >> 16) - block_size * removed + a - 1) % ADLER_MOD
+            weak = (b << 16) | a
+
+        candidates = index.get(weak)
+        match = None
+        if candidates is not None:
+            match = candidates.get(_block_digest(buffer[i:i + block_size]))
+        if match is not None:
+            if position > literal:
+                writer.add_data(buffer[literal - buffer_start:i])
+            writer.add_copy(match, block_size)
+            copied += block_size
+            position = literal = window_end
+            weak = None
+            continue
+
+        position += 1
+        if position - literal >= MAX_DATA_SIZE:
+            writer.add_data(buffer[literal - buffer_start:position - buffer_start])
+            literal = position
+
+    if end > literal:
+        writer.add_data(pread(fp, end - literal, literal))
+    return copied
+
+
+class _OpWriter:
+    """Merges adjacent ops and writes them zlib-compressed."""
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.compressor = zlib.compressobj(9)
+        self.copy = None
+        self.data = bytearray()
+
+    def _write(self, data):
+        self.fp.write(self.compressor.compress(data))
+
+    def _flush_copy(self):
+        if self.copy is not None:
+            self._write(bytes(DeltaOp(OP_COPY, *self.copy)))
+            self.copy = None
+
+    def _flush_data(self):
+        if self.data:
+            self._write(bytes(DeltaOp(OP_DATA, 0, len(self.data))))
+            self._write(bytes(self.data))
+            self.data = bytearray()
+
+    def add_copy(self, offset, size):
+        self._flush_data()
+        if self.copy is not None and self.copy[0] + self.copy[1] == offset:
+            self.copy = (self.copy[0], self.copy[1] + size)
+            return
+        self._flush_copy()
+        self.copy = (offset, size)
+
+    def add_data(self, data):
+        self._flush_copy()
+        self.data += data
+        if len(self.data) >= MAX_DATA_SIZE:
+            self._flush_data()
+
+    def close(self):
+        self._flush_copy()
+        self._flush_data()
+        self.fp.write(self.compressor.flush())
+
+
+def create_patch(source, target, patch, block_size=DEFAULT_BLOCK_SIZE):
+    """Writes a patch turning the NRO source into the NRO target.
+
+    Both files are split into regions (see read_regions). The source blocks of a region
+    (aligned to its start) are indexed by Adler-32 and digest, the same region of the
+    target is searched for them at every byte offset with a rolling hash (see
+    _diff_region). Matches become COPY ops, everything else is stored as DATA. Sections
+    which moved in the file and data behind inserted or removed bytes are both found.
+
+    Returns a dict with the sizes of source, target and patch and the copied/literal bytes.
+
+    Args:
+        source (str): Path to the old NRO
+        target (str): Path to the new NRO
+        patch (str): Output path of the patch
+        block_size (int): Matching granularity (Default: 16 KiB)
+    """
+    with open(source, "rb") as source_fp, open(target, "rb") as target_fp, \
+            open(patch, "wb") as patch_fp:
+        source_regions = {name: (start, end) for name, start, end in read_regions(source_fp)}
+        target_regions = read_regions(target_fp)
+
+        header = DeltaHeader()
+        header.magic = DELTAMAGIC
+        header.version = DELTA_VERSION
+        header.blockSize = block_size
+        header.sourceSize = file_size(source_fp)
+        header.targetSize = file_size(target_fp)
+        header.sourceHash[:] = bytes.fromhex(hash_range(source_fp, 0, header.sourceSize))
+        patch_fp.write(bytes(header))
+
+        writer = _OpWriter(patch_fp)
+        copied = 0
+        for name, start, end in target_regions:
+            source_region = source_regions.get(name)
+            index = _index_region(source_fp, *source_region, block_size) if source_region else {}
+            copied += _diff_region(target_fp, start, end, index, block_size, writer)
+        writer.close()
+        stats = {"copied": copied, "literal": header.targetSize - copied}
+
+        header.targetHash[:] = bytes.fromhex(hash_range(target_fp, 0, header.targetSize))
+        patch_fp.seek(0)
+        patch_fp.write(bytes(header))
+        patch_fp.seek(0, os.SEEK_END)
+        stats.update(
+            source_size=header.sourceSize, target_size=header.targetSize,
+            patch_size=patch_fp.tell(),
+        )
+    return stats
+
+
+class _InflateReader:
+    """Reads the decompressed op stream in bounded pieces."""
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.decompressor = zlib.decompressobj()
+
+    def read(self, size):
+        chunks = []
+        remaining = size
+        while remaining > 0:
+            data = self.decompressor.unconsumed_tail
+            if not data:
+                data = self.fp.read(64 * 1024)
+                if not data:
+                    break
+            chunk = self.decompressor.decompress(data, remaining)
+            chunks.append(chunk)
+            remaining -= len(chunk)
+        return b"".join(chunks)
+
+    def read_exactly(self, size):
+        data = self.read(size)
+        if len(data) != size:
+            raise EOFError("Patch is truncated")
+        return data
+
+
+def read_patch_header(fp):
+    """Reads and checks the DeltaHeader of a patch file object."""
+    data = fp.read(sizeof(DeltaHeader))
+    if len(data) < sizeof(DeltaHeader):
+        raise ValueError("File is too small to be a patch")
+    header = DeltaHeader.from_buffer_copy(data)
+    if header.magic != DELTAMAGIC:
+        raise ValueError("Patch magic is wrong, should be 'NROD'")
+    if header.version != DELTA_VERSION:
+        raise NotImplementedError("Patch version {0} is not supported".format(header.version))
+    return header
+
+
+def apply_patch(source, patch, output):
+    """Applies a patch to source and atomically writes the result to output.
+
+    The op stream is decompressed in bounded pieces, COPY ops go through copy_range, so
+    memory use doesn't depend on the NRO size. The source is checked before and the result
+    after patching against the hashes stored in the patch; output is only replaced if both
+    match. output may be the source itself.
+
+    Args:
+        source (str): Path to the old NRO
+        patch (str): Path to the patch
+        output (str): Output path of the new NRO
+    """
+    with open(source, "rb") as source_fp, open(patch, "rb") as patch_fp:
+        header = read_patch_header(patch_fp)
+        if file_size(source_fp) != header.sourceSize or \
+                hash_range(source_fp, 0, header.sourceSize) != bytes(header.sourceHash).hex():
+            raise ValueError("Source does not match the patch")
+
+        with atomic_write(output, mode_from=source) as out_fp:
+            ops = _InflateReader(patch_fp)
+            while True:
+                data = ops.read(sizeof(DeltaOp))
+                if not data:
+                    break
+                if len(data) < sizeof(DeltaOp):
+                    raise EOFError("Patch is truncated")
+                op = DeltaOp.from_buffer_copy(data)
+                if op.type == OP_COPY:
+                    if op.offset + op.size > header.sourceSize:
+                        raise ValueError("COPY op exceeds the source")
+                    copy_range(source_fp, op.offset, op.size, out_fp)
+                elif op.type == OP_DATA:
+                    remaining = op.size
+                    while remaining > 0:
+                        chunk = ops.read_exactly(min(remaining, MAX_DATA_SIZE))
+                        out_fp.write(chunk)
+                        remaining -= len(chunk)
+                else:
+                    raise ValueError("Unknown op type {0}".format(op.type))
+            out_fp.flush()
+
+            if out_fp.tell() != header.targetSize or \
+                    hash_range(out_fp, 0, header.targetSize) != bytes(header.targetHash).hex():
+                raise ValueError("Patched file does not match the target hash")
+            # output may be source, which Windows can't replace while it is open
+            source_fp.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create and apply binary patches between NROs.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    diff_parser = subparsers.add_parser("diff", help="Create a patch from source to target")
+    diff_parser.add_argument("source", help="Old NRO")
+    diff_parser.add_argument("target", help="New NRO")
+    diff_parser.add_argument("patch", help="Output patch file")
+    diff_parser.add_argument(
+        "--block-size", type=int, default=DEFAULT_BLOCK_SIZE, help="Matching granularity"
+    )
+
+    apply_parser = subparsers.add_parser("apply", help="Apply a patch")
+    apply_parser.add_argument("source", help="Old NRO")
+    apply_parser.add_argument("patch", help="Patch file")
+    apply_parser.add_argument("output", help="Output path, may be the source itself")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "diff":
+        stats = create_patch(args.source, args.target, args.patch, args.block_size)
+        print("Patch: {patch_size} bytes ({copied} copied, {literal} literal of {target_size})"
+              .format(**stats))
+    else:
+        apply_patch(args.source, args.patch, args.output)
+
+
+if __name__ == "__main__":
+    main()
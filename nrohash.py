@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from nrohelper import IO_WORKERS, NROHelper, hash_range
+from nroscan import expand_paths
+from nrotrace import NULL_TRACER, Tracer
+
+
+def hash_file(path, algorithm="sha256", tracer=None):
+    """Hashes all sections of a single NRO and checks its build_id.
+
+    Returns a record with path, build_id, build_id_ok and a digest per section.
+
+    Args:
+        path (str): Path to the NRO file
+        algorithm (str): Any hashlib algorithm (Default: "sha256")
+        tracer (nrotrace.Tracer): Records operation timings and I/O counts (Default: disabled)
+    """
+    tracer = tracer or NULL_TRACER
+    record = {"path": path}
+    try:
+        nro = NROHelper(path, lazy=True, tracer=tracer, read_only=True)
+    except Exception as e:
+        record["error"] = str(e)
+        return record
+    try:
+        record["build_id"] = bytes(nro.nro.header.build_id).hex()
+        with tracer.span("verify_build_id"):
+            record["build_id_ok"] = nro.verify_build_id()
+        for name, (offset, size) in nro.get_sections().items():
+            with tracer.span("hash"):
+                record[name] = hash_range(nro.fp, offset, size, algorithm)
+    except (OSError, EOFError) as e:
+        record["error"] = str(e)
+    finally:
+        nro.close()
+    return record
+
+
+def hash_files(paths, algorithm="sha256", workers=None, tracer=None):
+    """Hashes many NROs in a thread pool and yields their records in order.
+
+    hashlib releases the GIL while hashing large buffers, so threads keep several reads and
+    digests in flight at once.
+
+    Args:
+        paths (iterable): NRO paths
+        algorithm (str): Any hashlib algorithm (Default: "sha256")
+        workers (int): Number of threads (Default: 2 * CPU count)
+        tracer (nrotrace.Tracer): Records operation timings and I/O counts (Default: disabled)
+    """
+    workers = workers or IO_WORKERS
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(lambda path: hash_file(path, algorithm, tracer), paths)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Hash NRO segments and asset sections and verify build IDs."
+    )
+    parser.add_argument("paths", nargs="+", help="NRO files or directories")
+    parser.add_argument(
+        "--algorithm", default="sha256", help="hashlib algorithm, e.g. sha256 or blake2b"
+    )
+    parser.add_argument("--workers", type=int, help="Number of threads")
+    parser.add_argument("--trace", help="Write timing histograms and I/O counts to this file")
+    args = parser.parse_args(argv)
+    tracer = Tracer() if args.trace else None
+
+    for record in hash_files(expand_paths(args.paths), args.algorithm, args.workers, tracer):
+        print(json.dumps(record))
+    sys.stdout.flush()
+    if tracer:
+        tracer.export(args.trace)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,29 @@
 #!/usr/bin/env python3
 
+import enum
+import io
+import mmap
+import os
+from collections import OrderedDict
+from contextlib import contextmanager
+
 from nro import *
+from nrotrace import NULL_TRACER, TracedFile
+
+# hashlib, re, tempfile, threading and concurrent.futures are imported where they are
+# needed to keep startup of the CLI fast
+
+COPY_CHUNK_SIZE = 1024 * 1024
+HASH_CHUNK_SIZE = 4 * 1024 * 1024
+SEGMENT_NAMES = ("text", "ro", "data")
+ASSET_NAMES = ("icon", "nacp", "romfs")
+# Default thread count of the batch tools, which mostly wait for I/O
+IO_WORKERS = 2 * (os.cpu_count() or 1)
+# How often (ms) the GUIs check on background work from the Tk thread
+POLL_INTERVAL = 50
+
+# ELF note header (namesz = 4, descsz, type = NT_GNU_BUILD_ID) followed by the "GNU" name
+GNU_BUILD_ID_NOTE = rb"\x04\x00\x00\x00(.{4})\x03\x00\x00\x00GNU\x00"
 
 
 def pad_blocksize(value, block=64):
@@ -15,84 +38,991 @@ def pad_blocksize(value, block=64):
     return value
 
 
-class NROHelper:
-    def __init__(self, f):
+def pread(fp, size, offset):
+    """Reads size bytes at offset without relying on the file position where possible.
+
+    Args:
+        fp (file): File object to read from
+        size (int): Number of bytes to read
+        offset (int): Absolute offset in the file
+    """
+    if isinstance(fp, TracedFile):
+        data = pread(fp.raw, size, offset)
+        fp.tracer.count_io("pread", len(data))
+        return data
+    if isinstance(fp, PooledFile):
+        raw = fp.acquire()
+        try:
+            return pread(raw, size, offset)
+        finally:
+            fp.release(raw)
+    if hasattr(os, "pread"):
         try:
-            self.fp = open(f, 'r+b')
-        except:
-            raise FileNotFoundError("File not found")
+            return os.pread(fp.fileno(), size, offset)
+        except (AttributeError, OSError, ValueError):
+            # Not backed by a file descriptor (e.g. BytesIO)
+            pass
+    fp.seek(offset)
+    return fp.read(size)
+
+
+def pwrite(fp, data, offset):
+    """Writes data at offset without relying on the file position where possible.
+
+    Args:
+        fp (file): File object to write to
+        data (bytes): Data to write
+        offset (int): Absolute offset in the file
+    """
+    if isinstance(fp, TracedFile):
+        pwrite(fp.raw, data, offset)
+        fp.tracer.count_io("pwrite", len(data))
+        return
+    if isinstance(fp, PooledFile):
+        raw = fp.acquire()
+        try:
+            pwrite(raw, data, offset)
+        finally:
+            fp.release(raw)
+        return
+    if hasattr(os, "pwrite"):
+        try:
+            fd = fp.fileno()
+        except (AttributeError, OSError, ValueError):
+            fd = None
+        if fd is not None:
+            fp.flush()
+            written = 0
+            while written < len(data):
+                written += os.pwrite(fd, data[written:], offset + written)
+            return
+    fp.seek(offset)
+    fp.write(data)
+
+
+def dirty_ranges(old, new, block=64):
+    """Returns the merged (start, end) ranges of all blocks which differ between old and new.
+
+    Args:
+        old (bytes): Original data
+        new (bytes): Modified data of the same size
+        block (int): Comparison granularity (Default: 64)
+    """
+    ranges = []
+    for start in range(0, len(new), block):
+        end = min(start + block, len(new))
+        if old[start:end] != new[start:end]:
+            if ranges and ranges[-1][1] == start:
+                ranges[-1] = (ranges[-1][0], end)
+            else:
+                ranges.append((start, end))
+    return ranges
+
+
+class FilePool:
+    """Bounded pool of open files for PooledFile.
+
+    Every read or write borrows a file exclusively, so threads never share a descriptor or
+    file position, and returns it afterwards. At most max_idle returned files stay open, the
+    least recently used are closed first. With max_idle=0 every operation opens and closes
+    its own short-lived descriptor.
+
+    Args:
+        max_idle (int): Maximum number of idle open files (Default: 64)
+    """
+
+    def __init__(self, max_idle=64):
+        import threading
+
+        self.max_idle = max_idle
+        # (path, mode) -> idle files, least recently used key first
+        self._idle = OrderedDict()
+        self._idle_count = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, path, mode="rb"):
+        """Returns an open unbuffered file for path, which must be passed to release()."""
+        with self._lock:
+            files = self._idle.get((path, mode))
+            if files:
+                self._idle_count -= 1
+                raw = files.pop()
+                if not files:
+                    del self._idle[(path, mode)]
+                return raw
+        return open(path, mode, buffering=0)
+
+    def release(self, raw, path, mode="rb"):
+        """Returns a file from acquire() to the pool, closing the least recently used."""
+        with self._lock:
+            self._idle.setdefault((path, mode), []).append(raw)
+            self._idle.move_to_end((path, mode))
+            self._idle_count += 1
+            evicted = []
+            while self._idle_count > self.max_idle:
+                key, files = next(iter(self._idle.items()))
+                evicted.append(files.pop(0))
+                if not files:
+                    del self._idle[key]
+                self._idle_count -= 1
+        for raw in evicted:
+            raw.close()
+
+    def discard(self, path):
+        """Closes all idle files of path, e.g. after it was replaced."""
+        with self._lock:
+            evicted = []
+            for key in [key for key in self._idle if key[0] == path]:
+                evicted.extend(self._idle.pop(key))
+            self._idle_count -= len(evicted)
+        for raw in evicted:
+            raw.close()
+
+    def close(self):
+        """Closes all idle files."""
+        with self._lock:
+            evicted = [raw for files in self._idle.values() for raw in files]
+            self._idle.clear()
+            self._idle_count = 0
+        for raw in evicted:
+            raw.close()
+
+
+class PooledFile(io.RawIOBase):
+    """Handle-less file object which borrows a descriptor from a FilePool for every call.
+
+    nrohelper's pread/pwrite/copy_range/file_size recognize it and do one positional call
+    per borrowed descriptor. read/write/seek work as well, with the position kept here.
+    fileno() is not supported, so nothing can hold on to a pooled descriptor.
+
+    Args:
+        pool (FilePool): Pool to borrow descriptors from
+        path (str): Path to the file
+        mode (str): "rb" or "r+b" (Default: "rb")
+    """
+
+    def __init__(self, pool, path, mode="rb"):
+        super().__init__()
+        self.pool = pool
+        self.path = path
+        self.mode = mode
+        self._position = 0
+        # Fail early like open() would
+        self.release(self.acquire())
+
+    def acquire(self):
+        return self.pool.acquire(self.path, self.mode)
+
+    def release(self, raw):
+        self.pool.release(raw, self.path, self.mode)
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return "+" in self.mode or "w" in self.mode
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = pread(self, len(buffer), self._position)
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def write(self, data):
+        data = bytes(data)
+        pwrite(self, data, self._position)
+        self._position += len(data)
+        return len(data)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._position
+        elif whence == os.SEEK_END:
+            offset += file_size(self)
+        self._position = offset
+        return offset
+
+    def tell(self):
+        return self._position
+
+
+class Cancelled(Exception):
+    """Raised by copy_range when its cancel event is set."""
+
+
+def copy_range(fp, offset, size, dst, chunk_size=COPY_CHUNK_SIZE, progress=None, cancel=None):
+    """Copies size bytes starting at offset from fp to dst.
+
+    Uses os.copy_file_range or os.sendfile where available so the data never passes through
+    Python, otherwise falls back to chunked reads of at most chunk_size bytes.
+
+    Args:
+        fp (file): Source file object
+        offset (int): Absolute offset in the source file
+        size (int): Number of bytes to copy
+        dst (file): Destination file object (regular file, pipe, BytesIO, ...)
+        chunk_size (int): Chunk size for the fallback path (Default: 1 MiB)
+        progress (callable): Called with the number of bytes copied so far after every chunk.
+            Kernel copies are split into chunks of chunk_size as well then.
+        cancel (threading.Event): Checked before every chunk, Cancelled is raised once set
+    """
+    if isinstance(fp, TracedFile):
+        copy_range(fp.raw, offset, size, dst, chunk_size, progress, cancel)
+        fp.tracer.count_io("copy", size)
+        return
+    if isinstance(fp, PooledFile):
+        raw = fp.acquire()
+        try:
+            copy_range(raw, offset, size, dst, chunk_size, progress, cancel)
+        finally:
+            fp.release(raw)
+        return
+    total = size
+    monitored = progress is not None or cancel is not None
+
+    def step(copied):
+        if progress is not None:
+            progress(total - size + copied)
+        if cancel is not None and cancel.is_set():
+            raise Cancelled("Copy was cancelled")
+
+    if cancel is not None and cancel.is_set():
+        raise Cancelled("Copy was cancelled")
+
+    try:
+        out_fd = dst.fileno()
+    except (AttributeError, OSError, ValueError):
+        out_fd = None
+
+    try:
+        in_fd = fp.fileno()
+    except (AttributeError, OSError, ValueError):
+        in_fd = None
+
+    if in_fd is not None and out_fd is not None:
+        dst.flush()
+        for kernel_copy in (_copy_file_range, _sendfile):
+            copied = kernel_copy(
+                in_fd, out_fd, offset, size, chunk_size if monitored else size,
+                step if monitored else None,
+            )
+            if copied is None:
+                continue
+            offset += copied
+            size -= copied
+            if dst.seekable():
+                # Resync the buffered position with the descriptor after the kernel copy
+                dst.seek(0, os.SEEK_CUR)
+            if size == 0:
+                return
+
+    while size > 0:
+        data = pread(fp, min(size, chunk_size), offset)
+        if not data:
+            raise EOFError("Unexpected end of file at offset {0:#x}".format(offset))
+        dst.write(data)
+        offset += len(data)
+        size -= len(data)
+        if monitored:
+            step(0)
+
+
+def _copy_file_range(in_fd, out_fd, offset, size, chunk_size=None, step=None):
+    """Copies with os.copy_file_range. Returns bytes copied or None if unsupported.
+
+    step is called with the bytes copied so far after every call of at most chunk_size bytes.
+    """
+    if not hasattr(os, "copy_file_range"):
+        return None
+    chunk_size = chunk_size or size
+    copied = 0
+    try:
+        while copied < size:
+            n = os.copy_file_range(in_fd, out_fd, min(size - copied, chunk_size), offset + copied)
+            if n == 0:
+                break
+            copied += n
+            if step is not None:
+                step(copied)
+    except OSError:
+        if copied == 0:
+            return None
+    return copied
+
+
+def _sendfile(in_fd, out_fd, offset, size, chunk_size=None, step=None):
+    """Copies with os.sendfile. Returns bytes copied or None if unsupported."""
+    if not hasattr(os, "sendfile"):
+        return None
+    chunk_size = chunk_size or size
+    copied = 0
+    try:
+        while copied < size:
+            n = os.sendfile(out_fd, in_fd, offset + copied, min(size - copied, chunk_size))
+            if n == 0:
+                break
+            copied += n
+            if step is not None:
+                step(copied)
+    except OSError:
+        if copied == 0:
+            return None
+    return copied
+
+
+def hash_range(fp, offset, size, algorithm="sha256", chunk_size=HASH_CHUNK_SIZE):
+    """Hashes size bytes at offset with chunked reads and returns the hex digest.
+
+    Args:
+        fp (file): File object to read from
+        offset (int): Absolute offset in the file
+        size (int): Number of bytes to hash
+        algorithm (str): Any hashlib algorithm, e.g. "sha256" or "blake2b" (Default: "sha256")
+        chunk_size (int): Read size (Default: 4 MiB)
+    """
+    import hashlib
+
+    digest = hashlib.new(algorithm)
+    while size > 0:
+        data = pread(fp, min(size, chunk_size), offset)
+        if not data:
+            raise EOFError("Unexpected end of file at offset {0:#x}".format(offset))
+        digest.update(data)
+        offset += len(data)
+        size -= len(data)
+    return digest.hexdigest()
+
+
+def read_nro_header(fp):
+    """Reads and checks the NRO header with a single pread, raises ValueError for non-NROs.
+
+    Args:
+        fp (file): File object to read from
+    """
+    data = pread(fp, sizeof(NRO), 0)
+    if len(data) < sizeof(NRO):
+        raise ValueError("File is too small to be an NRO")
+    nro = NRO.from_buffer_copy(data)
+    if nro.header.magic != NROHEADERMAGIC:
+        raise ValueError("Header magic is wrong, should be 'NRO0'")
+    return nro
+
+
+def read_headers(fp):
+    """Reads the NRO header and the Asset header behind it with two preads.
+
+    Returns (nro, asset), asset is None if there is no (complete) Assets section. Nothing is
+    checked against the file size, see validate_layout() for that.
+
+    Args:
+        fp (file): File object to read from
+    """
+    nro = read_nro_header(fp)
+    data = pread(fp, sizeof(Asset), nro.header.size)
+    if len(data) < sizeof(Asset) or data[:len(ASSETHEADERMAGIC)] != ASSETHEADERMAGIC:
+        return nro, None
+    return nro, Asset.from_buffer_copy(data)
+
+
+class ProbeResult(enum.Enum):
+    """Result of probe(). TRUNCATED covers every file with the NRO magic whose headers point
+    past the data they describe."""
+    NOT_NRO = 0
+    TRUNCATED = 1
+    VALID_WITHOUT_ASSETS = 2
+    VALID_WITH_ASSETS = 3
+
+
+def probe(path):
+    """Classifies a file without raising for non-NROs.
+
+    Valid files take two small reads, a third one tells truncated files from non-NROs. The
+    NRO size and the segments are checked like validate_layout() does, the asset sections
+    only against the file size.
+
+    Args:
+        path (str): Path to the file
+    """
+    with open(path, "rb", buffering=0) as fp:
+        size = os.fstat(fp.fileno()).st_size
+        try:
+            nro, asset = read_headers(fp)
+        except ValueError:
+            magic_offset = NRO.header.offset + NRO.Header.magic.offset
+            if pread(fp, len(NROHEADERMAGIC), magic_offset) == NROHEADERMAGIC:
+                return ProbeResult.TRUNCATED
+            return ProbeResult.NOT_NRO
+
+        if not sizeof(NRO) <= nro.header.size <= size:
+            return ProbeResult.TRUNCATED
+        for segment in nro.header.segmentHeader:
+            if segment.offset + segment.size > nro.header.size:
+                return ProbeResult.TRUNCATED
+        if asset is None:
+            if nro.header.size + sizeof(Asset) > size and \
+                    pread(fp, len(ASSETHEADERMAGIC), nro.header.size) == ASSETHEADERMAGIC:
+                return ProbeResult.TRUNCATED
+            # e.g. libtransistor NROs
+            return ProbeResult.VALID_WITHOUT_ASSETS
+
+        for section in (asset.icon, asset.nacp, asset.romfs):
+            if nro.header.size + section.offset + section.size > size:
+                return ProbeResult.TRUNCATED
+        return ProbeResult.VALID_WITH_ASSETS
+
+
+class NROValidationError(Exception):
+    """Raised for NROs whose headers point outside the file or to overlapping ranges.
+
+    Args:
+        problems (list): Descriptions of everything that is wrong
+    """
+
+    def __init__(self, problems):
+        super().__init__("; ".join(problems))
+        self.problems = problems
+
+
+class NoAssetsError(NotImplementedError):
+    """Raised for NROs without an Assets section, which are not supported yet."""
 
-        self.nro = NRO.from_buffer_copy(self.fp.read(sizeof(NRO)))
+    def __init__(self):
+        super().__init__("NROs without an Assets section are currently not supported.")
+
+
+def file_identity(path, stat=None):
+    """Returns (path, size, mtime_ns, inode), which changes whenever the file is replaced or
+    modified.
+
+    Args:
+        path (str or os.DirEntry): File, a DirEntry saves the stat call on most platforms
+        stat (os.stat_result): Stat of path if already known
+    """
+    if isinstance(path, os.DirEntry):
+        # DirEntry.stat() has no inode on Windows, DirEntry.inode() always does
+        stat = stat or path.stat()
+        return path.path, stat.st_size, stat.st_mtime_ns, path.inode()
+    stat = stat or os.stat(path)
+    return path, stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+
+def file_size(fp):
+    """Returns the size of a file object, also for file objects without a descriptor."""
+    if isinstance(fp, PooledFile):
+        raw = fp.acquire()
+        try:
+            return os.fstat(raw.fileno()).st_size
+        finally:
+            fp.release(raw)
+    try:
+        return os.fstat(fp.fileno()).st_size
+    except (AttributeError, OSError, ValueError):
+        position = fp.seek(0, os.SEEK_CUR)
+        size = fp.seek(0, os.SEEK_END)
+        fp.seek(position)
+        return size
+
+
+@contextmanager
+def atomic_write(path, mode_from=None, sync=True):
+    """Context manager yielding a binary file which atomically replaces path on success.
+
+    Data goes to a temporary file next to path. Once the block completes, the file is flushed,
+    fsynced, closed, given its permissions and renamed over path. If the block raises (also on
+    KeyboardInterrupt), the temporary file is deleted and path is left untouched. Files the
+    block reads from must be closed before it ends when replacing them, Windows can't rename
+    over open files.
+
+    Args:
+        path (str): Destination path
+        mode_from (str): Copy the permission bits of this file (Default: 0o644)
+        sync (bool): fsync before renaming, only caches which are rebuilt anyway should skip
+            it (Default: True)
+    """
+    import tempfile
+
+    path = os.path.abspath(path)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w+b") as tmp_file:
+            yield tmp_file
+            tmp_file.flush()
+            if sync:
+                os.fsync(tmp_file.fileno())
+        os.chmod(tmp_path, 0o644 if mode_from is None else os.stat(mode_from).st_mode & 0o7777)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def validate_layout(nro, asset, size):
+    """Checks all segment and asset ranges against the file size and against each other.
+
+    Works on parsed headers only and does no I/O. Returns a list of problems, empty if the
+    layout is valid. Empty sections are ignored.
+
+    Args:
+        nro (NRO): NRO header
+        asset (Asset): Asset header or None for NROs without assets
+        size (int): File size
+    """
+    problems = []
+    nro_size = nro.header.size
+    if nro_size < sizeof(NRO):
+        problems.append("NRO size {0:#x} is smaller than the NRO header".format(nro_size))
+    if nro_size > size:
+        problems.append("NRO size {0:#x} exceeds the file size {1:#x}".format(nro_size, size))
+
+    ranges = []
+    for name, segment in zip(SEGMENT_NAMES, nro.header.segmentHeader):
+        start, end = segment.offset, segment.offset + segment.size
+        if end > nro_size:
+            problems.append("{0} segment {1:#x}-{2:#x} exceeds the NRO size {3:#x}".format(
+                name, start, end, nro_size
+            ))
+        ranges.append((name, start, end))
+
+    if asset is not None:
+        ranges.append(("asset header", nro_size, nro_size + sizeof(Asset)))
+        if nro_size + sizeof(Asset) > size:
+            problems.append("Asset header exceeds the file size {0:#x}".format(size))
+        for name in ASSET_NAMES:
+            section = getattr(asset, name)
+            start = nro_size + section.offset
+            end = start + section.size
+            if section.size and end > size:
+                problems.append("{0} section {1:#x}-{2:#x} exceeds the file size {3:#x}".format(
+                    name, start, end, size
+                ))
+            ranges.append((name, start, end))
+        if 0 < asset.nacp.size < sizeof(NACP):
+            problems.append("nacp section is smaller than a NACP ({0:#x} < {1:#x})".format(
+                asset.nacp.size, sizeof(NACP)
+            ))
+
+    # Compare every range with the one reaching furthest so far, which also catches ranges
+    # nested in a larger one
+    furthest = None
+    for name, start, end in sorted((r for r in ranges if r[2] > r[1]), key=lambda r: r[1]):
+        if furthest is not None and start < furthest[2]:
+            problems.append("{0} {1:#x}-{2:#x} overlaps {3} {4:#x}-{5:#x}".format(
+                name, start, end, *furthest
+            ))
+        if furthest is None or end > furthest[2]:
+            furthest = (name, start, end)
+    return problems
+
+
+def validate(f, full=False):
+    """Validates an NRO without trusting any of its headers.
+
+    The header-only mode reads the NRO and asset headers and checks all ranges with
+    validate_layout(). The full mode additionally reads the NACP, checks the icon's JPEG
+    marker and the RomFS header tables and verifies the build ID.
+
+    Returns a list of problems, empty if the NRO is valid.
+
+    Args:
+        f (str or file): Path to the NRO file or a seekable file object
+        full (bool): Also check section contents (Default: False)
+    """
+    fp = open(f, "rb", buffering=0) if not hasattr(f, "read") else f
+    try:
+        size = file_size(fp)
+        try:
+            nro, asset = read_headers(fp)
+        except ValueError as e:
+            return [str(e)]
+        problems = validate_layout(nro, asset, size)
+        if problems or not full:
+            return problems
+
+        if asset is not None:
+            problems.extend(_validate_assets(fp, nro, asset))
+            helper = NROHelper(fp, lazy=True)
+            try:
+                if helper.verify_build_id() is False:
+                    problems.append("Build ID does not match the GNU build ID note")
+            finally:
+                helper.close()
+        return problems
+    finally:
+        if fp is not f:
+            fp.close()
+
+
+def _validate_assets(fp, nro, asset):
+    from romfs import RomFSHeader
+
+    problems = []
+    if asset.icon.size:
+        if pread(fp, 2, nro.header.size + asset.icon.offset) != b"\xff\xd8":
+            problems.append("icon is not a JPEG")
+
+    if asset.nacp.size:
+        nacp = NACP.from_buffer_copy(pread(fp, sizeof(NACP), nro.header.size + asset.nacp.offset))
+        try:
+            for entry in nacp.title:
+                entry.get_name()
+                entry.get_publisher()
+            nacp.get_version()
+        except UnicodeDecodeError:
+            problems.append("nacp contains invalid UTF-8")
+
+    if asset.romfs.size:
+        if asset.romfs.size < sizeof(RomFSHeader):
+            return problems + ["romfs section is smaller than a RomFS header"]
+        header = RomFSHeader.from_buffer_copy(
+            pread(fp, sizeof(RomFSHeader), nro.header.size + asset.romfs.offset)
+        )
+        if header.headerSize != sizeof(RomFSHeader):
+            return problems + ["romfs header size is {0:#x}, should be {1:#x}".format(
+                header.headerSize, sizeof(RomFSHeader)
+            )]
+        for table in ("dirHashTable", "dirMetaTable", "fileHashTable", "fileMetaTable"):
+            offset = getattr(header, table + "Offset")
+            if offset + getattr(header, table + "Size") > asset.romfs.size:
+                problems.append("romfs {0} exceeds the RomFS".format(table))
+        if header.dataOffset > asset.romfs.size:
+            problems.append("romfs data offset exceeds the RomFS")
+    return problems
+
+
+class NROHelper:
+    """Helper for reading and editing NRO files.
+
+    Args:
+        f (str or file): Path to the NRO file or a seekable file object (not closed by close())
+        lazy (bool): Memory-map the file and only read icon, NACP and RomFS when they are
+            accessed. Icon and RomFS are returned as memoryviews over the mapping then.
+            (Default: False)
+        zero_copy (bool): Like lazy, but NRO, Asset and NACP are overlaid on a writable
+            mapping instead of being copied. Edits go straight into the mapping and save()
+            only flushes it. (Default: False)
+        tracer (nrotrace.Tracer): Records operation timings and I/O counts (Default: disabled)
+        read_only (bool): Open the file read-only, saving raises ValueError (Default: False)
+        file_pool (FilePool): Don't keep the file open, every read and write borrows a
+            descriptor from the pool instead. Needs a path, the object can then be shared
+            between threads and any number of objects use at most the pool's descriptors.
+            Assets are read on access in lazy mode. (Default: keep one file open)
+
+    Use it as a context manager or call close() to release the file deterministically.
+    """
+
+    def __init__(self, f, lazy=False, zero_copy=False, tracer=None, read_only=False,
+                 file_pool=None):
+        if hasattr(f, "read"):
+            if file_pool is not None:
+                raise ValueError("file_pool needs a path")
+            self.path = None
+            self._file = f
+        else:
+            self.path = f
+            self._file = None
+        if zero_copy and (read_only or file_pool is not None):
+            raise ValueError("zero_copy needs a writable file which stays open")
+        self.lazy = lazy or zero_copy
+        self.zero_copy = zero_copy
+        self.read_only = read_only
+        self.file_pool = file_pool
+        self.tracer = tracer or NULL_TRACER
+        with self.tracer.span("open"):
+            self._open()
+
+    def _open(self):
+        mode = "rb" if self.read_only else "r+b"
+        if self._file is not None:
+            self.fp = self.tracer.wrap(self._file)
+            self.fp.seek(0)
+        elif self.file_pool is not None:
+            try:
+                self.fp = self.tracer.wrap(PooledFile(self.file_pool, self.path, mode))
+            except FileNotFoundError:
+                raise FileNotFoundError("File not found")
+        else:
+            try:
+                self.fp = self.tracer.wrap(open(self.path, mode))
+            except FileNotFoundError:
+                raise FileNotFoundError("File not found")
+
+        self._mapping = None
+        self._icon = None
+        self._nacp = None
+        self._nacp_saved = None
+        self._romfs = None
+
+        with self.tracer.span("header"):
+            self._read_header()
+
+        if self.lazy:
+            if self._mapping is None:
+                try:
+                    self._mapping = mmap.mmap(self.fp.fileno(), 0, access=mmap.ACCESS_READ)
+                except (AttributeError, OSError, ValueError):
+                    # Not backed by a file descriptor, assets are read on access instead
+                    pass
+        else:
+            self._icon = self._read_asset(self.asset.icon)
+            self._load_nacp()
+            self._romfs = self._read_asset(self.asset.romfs)
+
+    def _read_header(self):
+        try:
+            if self.zero_copy:
+                self._mapping = mmap.mmap(self.fp.fileno(), 0, access=mmap.ACCESS_WRITE)
+                self.nro = NRO.from_buffer(self._mapping)
+            else:
+                self.nro = NRO.from_buffer_copy(pread(self.fp, sizeof(NRO), 0))
+        except ValueError:
+            # Also raised by mmap for empty files
+            self.close()
+            raise ValueError("File is too small to be an NRO")
 
         if self.nro.header.magic != NROHEADERMAGIC:
-            self.fp.close()
+            self.close()
             raise Exception("Header magic is wrong, should be 'NRO0'")
 
-        self.fp.seek(self.nro.header.size)
+        # A truncated NRO would otherwise look like one without an Assets section
+        size = len(self._mapping) if self.zero_copy else file_size(self.fp)
+        if not sizeof(NRO) <= self.nro.header.size <= size:
+            self.close()
+            raise NROValidationError(validate_layout(self.nro, None, size))
+
         try:
-            self.asset = Asset.from_buffer_copy(self.fp.read(sizeof(Asset)))
+            if self.zero_copy:
+                self.asset = Asset.from_buffer(self._mapping, self.nro.header.size)
+            else:
+                self.asset = Asset.from_buffer_copy(
+                    pread(self.fp, sizeof(Asset), self.nro.header.size)
+                )
         except ValueError:
-            self.fp.close()
-            raise NotImplementedError("NROs without an Assets section are currently not supported.")
+            self.close()
+            raise NoAssetsError()
 
         if self.asset.magic != ASSETHEADERMAGIC:
-            self.fp.close()
+            self.close()
             raise Exception("Asset header magic is wrong, should be 'ASET'")
 
-        # Assets are located at: End of NRO (Beginning of Assets) + Asset Offset
-        self.fp.seek(self.nro.header.size + self.asset.icon.offset)
-        self.icon = self.fp.read(self.asset.icon.size)
+        problems = validate_layout(self.nro, self.asset, size)
+        if problems:
+            self.close()
+            raise NROValidationError(problems)
+
+    def _read_asset(self, section):
+        """Reads an asset section. Returns a memoryview over the mapping in lazy mode.
+
+        Args:
+            section (Asset.AssetSection): Section to read
+        """
+        with self.tracer.span("asset_read"):
+            # Assets are located at: End of NRO (Beginning of Assets) + Asset Offset
+            start = self.nro.header.size + section.offset
+            if self._mapping is not None:
+                return memoryview(self._mapping)[start:start + section.size]
+            return pread(self.fp, section.size, start)
+
+    @property
+    def icon(self):
+        if self._icon is None:
+            self._icon = self._read_asset(self.asset.icon)
+        return self._icon
+
+    @icon.setter
+    def icon(self, value):
+        self._icon = value
+
+    def _load_nacp(self):
+        with self.tracer.span("nacp_decode"):
+            if self.zero_copy:
+                self._nacp = NACP.from_buffer(
+                    self._mapping, self.nro.header.size + self.asset.nacp.offset
+                )
+            else:
+                self._nacp = NACP.from_buffer_copy(self._read_asset(self.asset.nacp))
+                # Kept to only write back changed bytes in save_nacp()
+                self._nacp_saved = bytes(self._nacp)
+
+    @property
+    def nacp(self):
+        if self._nacp is None:
+            self._load_nacp()
+        return self._nacp
+
+    @nacp.setter
+    def nacp(self, value):
+        self._nacp = value
+
+    @property
+    def romfs(self):
+        if self._romfs is None:
+            self._romfs = self._read_asset(self.asset.romfs)
+        return self._romfs
+
+    @romfs.setter
+    def romfs(self, value):
+        self._romfs = value
+
+    def stream_asset(self, section, dst, progress=None, cancel=None):
+        """Copies an asset section straight from the NRO to dst without loading it.
+
+        Args:
+            section (Asset.AssetSection): Section to copy
+            dst (file): Destination file object or pipe
+            progress (callable): Called with the number of bytes copied so far
+            cancel (threading.Event): Raises Cancelled once set
+        """
+        with self.tracer.span("extract"):
+            copy_range(
+                self.fp, self.nro.header.size + section.offset, section.size, dst,
+                progress=progress, cancel=cancel,
+            )
+
+    def get_sections(self):
+        """Returns a dict of section name -> (absolute offset, size) for segments and assets."""
+        sections = {}
+        for name, segment in zip(SEGMENT_NAMES, self.nro.header.segmentHeader):
+            sections[name] = (segment.offset, segment.size)
+        for name in ASSET_NAMES:
+            section = getattr(self.asset, name)
+            sections[name] = (self.nro.header.size + section.offset, section.size)
+        return sections
+
+    def hash_sections(self, algorithm="sha256", workers=None):
+        """Hashes every segment and asset section in a thread pool.
+
+        Returns a dict of section name -> hex digest. Hashing reads the file on disk, unsaved
+        edits are not included.
+
+        Args:
+            algorithm (str): Any hashlib algorithm, e.g. "sha256" or "blake2b" (Default: "sha256")
+            workers (int): Number of threads (Default: one per section)
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        sections = self.get_sections()
+        if not hasattr(os, "pread"):
+            # The seek + read fallback shares the file position
+            workers = 1
+        with ThreadPoolExecutor(max_workers=workers or len(sections)) as executor:
+            futures = {
+                name: executor.submit(hash_range, self.fp, offset, size, algorithm)
+                for name, (offset, size) in sections.items()
+            }
+            return {name: future.result() for name, future in futures.items()}
+
+    def verify_build_id(self):
+        """Checks the header build_id against the GNU build-id note in the text/ro segments.
+
+        Returns True if they match, False if they don't and None if no note was found.
+        """
+        import re
+
+        build_id = bytes(self.nro.header.build_id)
+        for segment in self.nro.header.segmentHeader[:2]:
+            data = pread(self.fp, segment.size, segment.offset)
+            for match in re.finditer(GNU_BUILD_ID_NOTE, data, re.DOTALL):
+                desc_size = int.from_bytes(match.group(1), "little")
+                if not 0 < desc_size <= len(build_id):
+                    continue
+                # The description directly follows the 4-byte "GNU" name
+                desc = data[match.end():match.end() + desc_size]
+                return build_id == desc.ljust(len(build_id), b"\x00")
+        return None
+
+    def get_romfs(self):
+        """Returns an indexed RomFS reader for random access to single files."""
+        from romfs import RomFS
+
+        return RomFS(self.fp, self.nro.header.size + self.asset.romfs.offset)
 
-        self.fp.seek(self.nro.header.size + self.asset.nacp.offset)
-        self.nacp = NACP.from_buffer_copy(self.fp.read(self.asset.nacp.size))
+    def get_symbols(self):
+        """Returns the dynamic symbol index (nromod0.SymbolIndex), cached by build ID."""
+        from nromod0 import load_symbols
 
-        self.fp.seek(self.nro.header.size + self.asset.romfs.offset)
-        self.romfs = self.fp.read(self.asset.romfs.size)
+        return load_symbols(self.fp)
+
+    def _extract(self, section, name, progress=None, cancel=None):
+        if hasattr(name, "write"):
+            self.stream_asset(section, name, progress, cancel)
+            return
+        try:
+            with open(name, "wb") as out_file:
+                self.stream_asset(section, out_file, progress, cancel)
+        except Cancelled:
+            os.unlink(name)
+            raise
 
     def extract_icon(self, name="icon.jpg"):
-        """Extracts icon to name."""
+        """Extracts icon to name (path or file object)."""
         if self.asset.icon.size != 0:
-            with open(name, "wb") as icon_file:
-                icon_file.write(self.icon)
+            self._extract(self.asset.icon, name)
         else:
             print("No icon available")
 
     def extract_nacp(self, name="control.nacp"):
-        """Extracts NACP to name."""
+        """Extracts NACP to name (path or file object)."""
         if self.asset.nacp.size != 0:
-            with open(name, "wb") as nacp_file:
-                nacp_file.write(bytes(self.nacp))
+            if hasattr(name, "write"):
+                name.write(bytes(self.nacp))
+            else:
+                with open(name, "wb") as nacp_file:
+                    nacp_file.write(bytes(self.nacp))
         else:
             print("No NACP available")
 
-    def extract_romfs(self, name="romfs.romfs"):
-        """Extracts RomFS to name."""
+    def extract_romfs(self, name="romfs.romfs", progress=None, cancel=None):
+        """Extracts RomFS to name (path or file object).
+
+        progress and cancel are passed on to copy_range. A partially written file is removed
+        when the extraction is cancelled.
+        """
         if self.asset.romfs.size != 0:
-            with open(name, "wb") as romfs_file:
-                romfs_file.write(self.romfs)
+            self._extract(self.asset.romfs, name, progress, cancel)
         else:
             print("No RomFS available")
 
-    def edit_name(self, name):
-        """Edits name of the NRO in the NACP (currently all languages)."""
+    def edit_name(self, name, languages=None):
+        """Edits name of the NRO in the NACP.
+
+        Args:
+            name (str): New name
+            languages (list): Title entry indices to edit (Default: all languages)
+        """
         if len(name) > 512:
             raise ValueError("Name must be < 512 characters")
 
         name = pad_blocksize(name.encode(), 512)
         name = ARRAY(c_byte, 512).from_buffer_copy(name)
-        for language in self.nacp.title:
+        for language in self._get_title_entries(languages):
             language.name = name
 
-    def edit_publisher(self, publisher):
-        """Edits publisher name of the NRO in the NACP (currently all languages)."""
+    def edit_publisher(self, publisher, languages=None):
+        """Edits publisher name of the NRO in the NACP.
+
+        Args:
+            publisher (str): New publisher name
+            languages (list): Title entry indices to edit (Default: all languages)
+        """
         if len(publisher) > 256:
             raise ValueError("Publisher name must be < 256 characters")
 
         publisher = pad_blocksize(publisher.encode(), 256)
         publisher = ARRAY(c_byte, 256).from_buffer_copy(publisher)
-        for language in self.nacp.title:
+        for language in self._get_title_entries(languages):
             language.publisher = publisher
 
+    def _get_title_entries(self, languages):
+        if languages is None:
+            return self.nacp.title
+        for language in languages:
+            if not 0 <= language < len(self.nacp.title):
+                raise ValueError("Language must be between 0 and 15")
+        return [self.nacp.title[language] for language in languages]
+
     def edit_version(self, version):
         """Edits the version in the NACP."""
         if len(version) > 16:
@@ -102,17 +1032,108 @@ class NROHelper:
         version = ARRAY(c_byte, 16).from_buffer_copy(version)
         self.nacp.displayVersion = version
 
+    def replace_icon(self, icon):
+        """Replaces the icon with new JPEG data and saves it.
+
+        If the new icon fits into the existing icon region it is patched in place. Otherwise
+        the following asset sections are shifted by streaming the file into a temporary file
+        next to it, which then atomically replaces the NRO.
+
+        Args:
+            icon (bytes): New icon (256x256 JPEG)
+        """
+        self._check_writable()
+        with self.tracer.span("replace_icon"):
+            icon = bytes(icon)
+            if len(icon) <= self.asset.icon.size:
+                pwrite(self.fp, icon, self.nro.header.size + self.asset.icon.offset)
+                if len(icon) != self.asset.icon.size:
+                    self.asset.icon.size = len(icon)
+                    self._save_asset_header()
+                self._icon = icon
+            else:
+                self._relayout_icon(icon)
+
+    def _check_writable(self):
+        if self.read_only:
+            raise ValueError("NRO was opened read-only")
+
+    def _save_asset_header(self):
+        if self.zero_copy:
+            self._mapping.flush()
+        else:
+            pwrite(self.fp, bytes(self.asset), self.nro.header.size)
+
+    def _relayout_icon(self, icon):
+        if self.path is None:
+            raise ValueError("Growing the icon requires an NRO opened by path")
+
+        base = self.nro.header.size
+        old_icon = self.asset.icon
+        icon_end = base + old_icon.offset + old_icon.size
+        delta = len(icon) - old_icon.size
+
+        asset = Asset.from_buffer_copy(self.asset)
+        asset.icon.size = len(icon)
+        for section in (asset.nacp, asset.romfs):
+            if section.offset >= old_icon.offset + old_icon.size:
+                section.offset += delta
+
+        path = os.path.abspath(self.path)
+        with atomic_write(path, mode_from=path) as out_file:
+            copy_range(self.fp, 0, base + old_icon.offset, out_file)
+            out_file.write(icon)
+            size = file_size(self.fp)
+            copy_range(self.fp, icon_end, size - icon_end, out_file)
+            out_file.seek(base)
+            out_file.write(bytes(asset))
+
+            # Keep unsaved NACP edits across reopening (zero-copy edits are already in the file)
+            nacp = None
+            if self._nacp is not None and not self.zero_copy:
+                nacp, nacp_saved = NACP.from_buffer_copy(self._nacp), self._nacp_saved
+
+            # The file is replaced when the block ends, which Windows refuses while it is open
+            self.close()
+            if self.file_pool is not None:
+                self.file_pool.discard(self.path)
+        self._open()
+
+        if nacp is not None:
+            self._nacp, self._nacp_saved = nacp, nacp_saved
+
     def save(self):
         """Saves NRO and asset header."""
-        self.fp.seek(0)
-        self.fp.write(bytes(self.nro))
-        self.fp.seek(self.nro.header.size)
-        self.fp.write(bytes(self.asset))
+        self._check_writable()
+        with self.tracer.span("save"):
+            if self.zero_copy:
+                self._mapping.flush()
+                return
+            pwrite(self.fp, bytes(self.nro), 0)
+            pwrite(self.fp, bytes(self.asset), self.nro.header.size)
 
     def save_nacp(self):
-        """Saves NACP."""
-        self.fp.seek(self.nro.header.size + self.asset.nacp.offset)
-        self.fp.write(bytes(self.nacp))
+        """Saves NACP, only the byte ranges which changed since loading are written.
+
+        Returns the number of bytes written (0 in zero-copy mode, which flushes the mapping).
+        """
+        self._check_writable()
+        with self.tracer.span("save"):
+            if self.zero_copy:
+                self._mapping.flush()
+                return 0
+
+            data = bytes(self.nacp)
+            if self._nacp_saved is None or len(self._nacp_saved) != len(data):
+                ranges = [(0, len(data))]
+            else:
+                ranges = dirty_ranges(self._nacp_saved, data)
+
+            offset = self.nro.header.size + self.asset.nacp.offset
+            for start, end in ranges:
+                pwrite(self.fp, data[start:end], offset + start)
+            self._nacp_saved = data
+            return sum(end - start for start, end in ranges)
 
     def get_name(self):
         """Returns first language entry name."""
@@ -122,8 +1143,41 @@ class NROHelper:
         """Returns first language entry publisher."""
         return self.nacp.title[0].get_publisher()
 
+    def close(self):
+        """Releases the memory mapping (if any) and closes the file."""
+        try:
+            if self._mapping is not None:
+                # Views handed out to callers keep the mapping alive
+                self._icon = None
+                self._romfs = None
+                if self.zero_copy:
+                    # Detach the overlays so they stay readable after the mapping is gone.
+                    # Opening may have failed before all of them were created.
+                    if hasattr(self, "nro"):
+                        self.nro = NRO.from_buffer_copy(self.nro)
+                    if hasattr(self, "asset"):
+                        self.asset = Asset.from_buffer_copy(self.asset)
+                    if self._nacp is not None:
+                        self._nacp = NACP.from_buffer_copy(self._nacp)
+        finally:
+            if self._mapping is not None:
+                try:
+                    self._mapping.close()
+                except BufferError:
+                    pass
+                self._mapping = None
+            if self._file is None:
+                self.fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
     def __del__(self):
-        self.fp.close()
+        if hasattr(self, "fp"):
+            self.close()
 
     def __repr__(self):
         name = self.nacp.title[0].get_name()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+
+import argparse
+import sys
+
+# Only the modules needed by the hot subcommands (info, probe, extract, edit) are imported at
+# startup. Batch tools and PIL are imported when their subcommand runs.
+import nrohelper
+
+VERSION = "0.1"
+
+# Subcommands handled by the main() of another module
+DELEGATES = {
+    "scan": ("nroscan", "Index a directory of NROs into a catalog"),
+    "hash": ("nrohash", "Hash segments and asset sections, verify build IDs"),
+    "verify": ("nroverify", "Validate headers and section ranges of many NROs"),
+    "batch-edit": ("nroedit", "Edit NACP metadata of many NROs at once"),
+    "store": ("nrostore", "Deduplicated export of icons, NACPs and RomFS images"),
+    "symbols": ("nromod0", "Resolve addresses to dynamic symbols via MOD0"),
+    "pack": ("nropack", "Build RomFS images and add or replace asset sections"),
+    "delta": ("nrodelta", "Create and apply binary patches between NRO versions"),
+    "archive": ("nroarchive", "Read NRO metadata from zip/tar archives"),
+    "nacp-stats": ("nronacp", "Summarize the NACPs of many NROs (requires NumPy)"),
+    "icons": ("nroicons", "Normalize icons and render thumbnails of many NROs"),
+    "serve": ("nroserver", "Serve metadata, icons and RomFS of a directory over HTTP"),
+}
+
+
+def print_json(data):
+    import json
+
+    json.dump(data, sys.stdout, ensure_ascii=False, indent=2)
+    print()
+
+
+def get_info(nro):
+    """Returns the metadata of an opened NROHelper as dict."""
+    sections = nro.get_sections()
+    return {
+        "path": nro.path,
+        "name": nro.get_name(),
+        "publisher": nro.get_publisher(),
+        "version": nro.nacp.get_version(),
+        "titles": [
+            {"language": i, "name": entry.get_name(), "publisher": entry.get_publisher()}
+            for i, entry in enumerate(nro.nacp.title)
+            if entry.get_name() or entry.get_publisher()
+        ],
+        "build_id": bytes(nro.nro.header.build_id).hex(),
+        "bss_size": nro.nro.header.bssSize,
+        "sections": {
+            name: {"offset": offset, "size": size} for name, (offset, size) in sections.items()
+        },
+    }
+
+
+def cmd_info(args):
+    with nrohelper.NROHelper(args.file, lazy=True, read_only=True) as nro:
+        if args.json:
+            print_json(get_info(nro))
+        else:
+            print(nro, end="")
+
+
+def cmd_probe(args):
+    results = {}
+    for path in args.files:
+        try:
+            results[path] = nrohelper.probe(path).name.lower()
+        except OSError as e:
+            results[path] = "error: {0}".format(e.strerror or e)
+    if args.json:
+        print_json(results)
+    else:
+        for path, result in results.items():
+            print("{0}: {1}".format(path, result))
+    return 0 if all(result.startswith("valid") for result in results.values()) else 1
+
+
+def cmd_extract(args):
+    with nrohelper.NROHelper(args.file, lazy=True, read_only=True) as nro:
+        if args.icon:
+            nro.extract_icon(args.icon)
+        if args.nacp:
+            nro.extract_nacp(args.nacp)
+        if args.romfs == "-":
+            nro.extract_romfs(sys.stdout.buffer)
+        elif args.romfs:
+            nro.extract_romfs(args.romfs)
+        if args.romfs_file:
+            romfs = nro.get_romfs()
+            output = args.output or "-"
+            if output == "-":
+                romfs.extract(args.romfs_file, sys.stdout.buffer)
+            else:
+                romfs.extract(args.romfs_file, output)
+
+
+def load_icon(path):
+    """Converts any image supported by PIL into a 256x256 JPEG NRO icon."""
+    from nroicons import normalize_icon
+
+    with open(path, "rb") as image_file:
+        return normalize_icon(image_file.read())
+
+
+def cmd_edit(args):
+    with nrohelper.NROHelper(args.file, lazy=True) as nro:
+        if args.name is not None:
+            nro.edit_name(args.name, args.languages)
+        if args.publisher is not None:
+            nro.edit_publisher(args.publisher, args.languages)
+        if args.version is not None:
+            nro.edit_version(args.version)
+        nro.save_nacp()
+        if args.icon:
+            nro.replace_icon(load_icon(args.icon))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="nrohelper_cli.py",
+        description="Inspect, extract and edit Nintendo Switch NRO files.",
+    )
+    parser.add_argument("--version", action="version", version="%(prog)s " + VERSION)
+    subparsers = parser.add_subparsers(dest="command", metavar="command", required=True)
+
+    info = subparsers.add_parser("info", help="Show metadata of an NRO")
+    info.add_argument("file")
+    info.add_argument("--json", action="store_true", help="Output as JSON")
+    info.set_defaults(func=cmd_info)
+
+    probe = subparsers.add_parser("probe", help="Check whether files are (valid) NROs")
+    probe.add_argument("files", nargs="+")
+    probe.add_argument("--json", action="store_true", help="Output as JSON")
+    probe.set_defaults(func=cmd_probe)
+
+    extract = subparsers.add_parser("extract", help="Extract icon, NACP or RomFS")
+    extract.add_argument("file")
+    extract.add_argument("--icon", metavar="PATH", help="Extract icon to PATH")
+    extract.add_argument("--nacp", metavar="PATH", help="Extract NACP to PATH")
+    extract.add_argument("--romfs", metavar="PATH", help="Extract RomFS to PATH ('-' for stdout)")
+    extract.add_argument("--romfs-file", metavar="FILE", help="Extract a single file from RomFS")
+    extract.add_argument("-o", "--output", help="Output for --romfs-file (Default: stdout)")
+    extract.set_defaults(func=cmd_extract)
+
+    edit = subparsers.add_parser("edit", help="Edit name, publisher, version or icon")
+    edit.add_argument("file")
+    edit.add_argument("--name")
+    edit.add_argument("--publisher")
+    edit.add_argument("--version")
+    edit.add_argument(
+        "--language", type=int, action="append", dest="languages",
+        help="Title entry index (0-15) to edit, can be repeated (Default: all languages)",
+    )
+    edit.add_argument("--icon", metavar="IMAGE", help="Replace icon (requires Pillow)")
+    edit.set_defaults(func=cmd_edit)
+
+    for name, (_, description) in DELEGATES.items():
+        delegate = subparsers.add_parser(name, help=description, add_help=False)
+        delegate.add_argument("args", nargs=argparse.REMAINDER)
+
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+
+    if argv and argv[0] in DELEGATES:
+        import importlib
+
+        module = importlib.import_module(DELEGATES[argv[0]][0])
+        return module.main(argv[1:])
+
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except Exception as e:
+        print("{0}: {1}".format(args.command, e), file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,15 +1,19 @@
 #!/usr/bin/env python3
 
-import io
 import os
 import sys
+import threading
 import tkinter as tk
 import webbrowser
-from tkinter import filedialog, messagebox
+from concurrent.futures import ThreadPoolExecutor
+from tkinter import filedialog, messagebox, ttk
 
 from PIL import Image, ImageTk
 
 import nrohelper
+from nroicons import ICON_SIZE, normalize_icon
+from nrolibrary_gui import LibraryView
+from nrothumbs import decode_icon
 
 VERSION = "0.1"
 
@@ -34,9 +38,88 @@ class Editor:
         self.version.set("0.0.0.0")
 
         self.image = None
+        self.new_icon = None
         self.data = None
         self.nrosize = 0
 
+        # Parsing, decoding, extraction and saving run on one worker thread, results are
+        # handed back to Tk by polling with after()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.busy = False
+        self.cancel_event = threading.Event()
+        self.progress_done = 0
+        self.progress_total = 0
+
+    def run_background(self, task, on_success, on_error=None, total=0, cancellable=False):
+        """Runs task() on the worker thread and calls on_success(result) or on_error(e) on
+        the Tk thread.
+
+        Args:
+            task (callable): Work to run, must not touch any Tk widgets
+            on_success (callable): Called with the result of task
+            on_error (callable): Called with the exception raised by task (Default: dialog)
+            total (int): Expected bytes for a determinate progress bar (Default: indeterminate)
+            cancellable (bool): Enable the cancel button, task should check cancel_event
+        """
+        if self.busy:
+            return
+        self.set_busy(True, total, cancellable)
+        future = self.executor.submit(task)
+
+        def poll():
+            if not future.done():
+                if self.progress_total:
+                    progressbar.configure(value=self.progress_done)
+                root.after(nrohelper.POLL_INTERVAL, poll)
+                return
+            self.set_busy(False)
+            try:
+                result = future.result()
+            except Exception as e:
+                if on_error is not None:
+                    on_error(e)
+                else:
+                    messagebox.showerror("Error", str(e))
+                return
+            on_success(result)
+
+        root.after(nrohelper.POLL_INTERVAL, poll)
+
+    def set_busy(self, busy, total=0, cancellable=False):
+        """Locks the UI while background work is running and shows its progress."""
+        self.busy = busy
+        self.cancel_event.clear()
+        self.progress_done = 0
+        self.progress_total = total
+        state = "disabled" if busy else "normal"
+        menubar.entryconfig("File", state=state)
+        if self.data is not None:
+            menubar.entryconfig("Extract", state=state)
+            for elem in self.elements:
+                elem.configure(state=state)
+
+        progressbar.stop()
+        if busy and total:
+            progressbar.configure(mode="determinate", maximum=total, value=0)
+        elif busy:
+            progressbar.configure(mode="indeterminate")
+            progressbar.start()
+        else:
+            progressbar.configure(mode="determinate", value=0)
+        cancel_button.configure(state="normal" if busy and cancellable else "disabled")
+
+    def set_progress(self, done):
+        """Progress callback for the worker thread, picked up by the next poll."""
+        self.progress_done = done
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def exit(self):
+        self.cancel_event.set()
+        self.executor.shutdown(wait=False)
+        root.quit()
+
     # NRO File browser
     def browse(self):
         tmpfilename = (
@@ -48,35 +131,60 @@ class Editor:
         )
         self.load_nro_data(tmpfilename)
 
+    # Library browser for a whole directory
+    def browse_library(self):
+        directory = filedialog.askdirectory(title="Select homebrew directory")
+        if directory:
+            LibraryView(root, directory, self.load_nro_data)
+
     # Load data from NRO specified in tmpfilename
     def load_nro_data(self, tmpfilename):
         if not tmpfilename:
             return False
-        try:
-            self.data = nrohelper.NROHelper(tmpfilename)
-        except NotImplementedError:
+
+        def load():
+            # Lazy: the RomFS is never read while loading
+            data = nrohelper.NROHelper(tmpfilename, lazy=True)
+            try:
+                image = decode_icon(data.icon, ICON_SIZE)
+            except Exception:
+                image = None
+            return data, image
+
+        def loaded(result):
+            self.show_nro_data(tmpfilename, *result)
+
+        self.run_background(load, loaded, self.show_load_error)
+
+    @staticmethod
+    def show_load_error(error):
+        if isinstance(error, NotImplementedError):
             messagebox.showerror(
                 "Error: Unsupported NRO",
                 "NRO files without Assets (e.g. those built with libtransistor) "
                 "are currently unsupported.",
             )
-            return False
-        except:
+        else:
             messagebox.showerror(
                 "Error: Not a valid NRO",
                 "This is not a (valid) Nintendo Switch NRO file.",
             )
-            return False
 
+    def show_nro_data(self, tmpfilename, data, image):
+        if self.data is not None:
+            self.data.close()
+        self.data = data
         self.filename = tmpfilename
+        self.new_icon = None
         self.name.set(self.data.get_name())
         self.author.set(self.data.get_publisher())
         self.version.set(self.data.nacp.get_version())
 
-        self.image = Image.open(io.BytesIO(self.data.icon))
-        image = ImageTk.PhotoImage(self.image)
-        self.imagebox.configure(image=image)
-        self.imagebox.image = image
+        if image is not None:
+            self.image = image
+            image = ImageTk.PhotoImage(self.image)
+            self.imagebox.configure(image=image)
+            self.imagebox.image = image
 
         if self.filename:
             # Enable text fields
@@ -112,18 +220,27 @@ class Editor:
                 ("All Files", "*.*"),
             ),
         )
-        self.image = Image.open(image_path).convert("RGB")
-        self.image = self.image.resize((256, 256), Image.ANTIALIAS)
-        buffer = io.BytesIO()
-        # if it's not already a jpeg, convert it into one
-        if self.image.format != "JPEG":
-            self.image.save(buffer, format="JPEG")
-            self.image = Image.open(buffer)
-
-        image2 = ImageTk.PhotoImage(self.image)
-        self.imagebox.configure(image=image2)
-
-        self.imagebox.image = image2
+        if not image_path:
+            return
+
+        def convert():
+            with open(image_path, "rb") as image_file:
+                # NRO icons are always 256x256 JPEGs
+                icon = normalize_icon(image_file.read())
+            return icon, decode_icon(icon, ICON_SIZE)
+
+        def converted(result):
+            self.new_icon, self.image = result
+            image2 = ImageTk.PhotoImage(self.image)
+            self.imagebox.configure(image=image2)
+
+            self.imagebox.image = image2
+
+        self.run_background(
+            convert,
+            converted,
+            lambda error: messagebox.showerror("Error", "Could not open image:\n" + str(error)),
+        )
 
     def save(self):
         name = self.name.get()
@@ -149,8 +266,19 @@ class Editor:
             messagebox.showerror("Saving failed", "Version must be < 16 characters")
             return False
 
-        self.data.save_nacp()
-        messagebox.showinfo("Saving completed", "Saving completed:\n" + self.filename)
+        new_icon = self.new_icon
+
+        def save():
+            self.data.save_nacp()
+            if new_icon is not None:
+                # May rewrite the whole file if the icon grows
+                self.data.replace_icon(new_icon)
+
+        def saved(result):
+            self.new_icon = None
+            messagebox.showinfo("Saving completed", "Saving completed:\n" + self.filename)
+
+        self.run_background(save, saved)
 
     def extract_icon(self):
         icon_filename = filedialog.asksaveasfilename(
@@ -161,8 +289,12 @@ class Editor:
         )
 
         if icon_filename:
-            self.data.extract_icon(icon_filename)
-            messagebox.showinfo("Extraction completed", "Icon extraction completed!")
+            self.run_background(
+                lambda: self.data.extract_icon(icon_filename),
+                lambda result: messagebox.showinfo(
+                    "Extraction completed", "Icon extraction completed!"
+                ),
+            )
 
     def extract_nacp(self):
         nacp_filename = filedialog.asksaveasfilename(
@@ -173,8 +305,12 @@ class Editor:
         )
 
         if nacp_filename:
-            self.data.extract_nacp(nacp_filename)
-            messagebox.showinfo("Extraction completed", "NACP extraction completed!")
+            self.run_background(
+                lambda: self.data.extract_nacp(nacp_filename),
+                lambda result: messagebox.showinfo(
+                    "Extraction completed", "NACP extraction completed!"
+                ),
+            )
 
     def extract_romfs(self):
         romfs_filename = filedialog.asksaveasfilename(
@@ -184,10 +320,26 @@ class Editor:
             initialfile=os.path.splitext(os.path.basename(self.filename))[0],
         )
 
-        if romfs_filename:
-            self.data.extract_romfs(romfs_filename)
+        if not romfs_filename:
+            return
+
+        def extracted(result):
             messagebox.showinfo("Extraction completed", "RomFS extraction completed!")
 
+        def failed(error):
+            if isinstance(error, nrohelper.Cancelled):
+                messagebox.showinfo("Extraction cancelled", "RomFS extraction was cancelled.")
+            else:
+                messagebox.showerror("Extraction failed", str(error))
+
+        self.run_background(
+            lambda: self.data.extract_romfs(romfs_filename, self.set_progress, self.cancel_event),
+            extracted,
+            failed,
+            total=self.data.asset.romfs.size,
+            cancellable=True,
+        )
+
     @staticmethod
     def open_source():
         webbrowser.open_new_tab("https://github.com/WiiDatabase/NROHelper")
@@ -236,9 +388,9 @@ t3 = tk.Entry(frame, state="disabled", width=40, textvariable=editor.version)
 t3.grid(row=2, column=1, padx=5)
 elems.append(t3)
 
-# b1 = tk.Button(frame, text="Replace image...", state="disabled", command=editor.browse_image)
-# b1.grid(row=3, column=1)
-# elems.append(b1)
+b1 = tk.Button(frame, text="Replace image...", state="disabled", command=editor.browse_image)
+b1.grid(row=3, column=1)
+elems.append(b1)
 
 # Icon preview
 im = Image.open(jpg_path)
@@ -248,6 +400,14 @@ canvas = tk.Label(frame, image=tkimage, width=256, height=256)
 canvas.grid(row=0, rowspan=8, column=2)
 editor.imagebox = canvas
 
+# Progress of background work
+status = tk.Frame(root)
+status.grid(row=4, column=2, columnspan=2, pady=5)
+progressbar = ttk.Progressbar(status, length=460, mode="determinate")
+progressbar.grid(row=0, column=0, padx=5)
+cancel_button = tk.Button(status, text="Cancel", state="disabled", command=editor.cancel)
+cancel_button.grid(row=0, column=1, padx=5)
+
 # Menubar
 menubar = tk.Menu(root)
 root.config(menu=menubar)
@@ -255,8 +415,9 @@ root.config(menu=menubar)
 # "File"
 file = tk.Menu(menubar, tearoff=0)
 file.add_command(label="Open", command=editor.browse)
+file.add_command(label="Open library...", command=editor.browse_library)
 file.add_command(label="Save", command=editor.save)
-file.add_command(label="Exit", command=root.quit)
+file.add_command(label="Exit", command=editor.exit)
 menubar.add_cascade(label="File", menu=file)
 
 # "Extract"
@@ -273,8 +434,9 @@ about_menu.add_command(label="Info", command=editor.version_info)
 menubar.add_cascade(label="About", menu=about_menu)
 
 # Main window
-root.geometry("575x265")
+root.geometry("575x300")
 root.resizable(0, 0)
+root.protocol("WM_DELETE_WINDOW", editor.exit)
 
 if len(sys.argv) > 1:
     editor.load_nro_data(sys.argv[1])
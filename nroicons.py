@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from PIL import Image
+
+from nrohelper import atomic_write
+from nroscan import expand_paths
+from nrothumbs import THUMBNAIL_QUALITY, THUMBNAIL_SIZES, decode_icon, read_icon
+
+ICON_SIZE = 256
+ICON_QUALITY = 95
+ICON_ALGORITHM = "sha256"
+
+
+def is_normalized(image):
+    """Returns True if image already is what NROs need: a 256x256 RGB baseline JPEG."""
+    return (
+        image.format == "JPEG"
+        and image.size == (ICON_SIZE, ICON_SIZE)
+        and image.mode == "RGB"
+        and not image.info.get("progressive")
+    )
+
+
+def normalize_icon(data):
+    """Converts an image (any format Pillow reads) into a 256x256 baseline JPEG icon.
+
+    Icons which already are one are returned unchanged, so they're never recompressed.
+    Larger JPEGs are decoded in draft mode at the smallest DCT scale of at least 256 pixels.
+
+    Args:
+        data (bytes): Encoded image
+    """
+    image = Image.open(io.BytesIO(data))
+    if is_normalized(image):
+        return bytes(data)
+    image.draft("RGB", (ICON_SIZE, ICON_SIZE))
+    image = image.convert("RGB")
+    if image.size != (ICON_SIZE, ICON_SIZE):
+        image = image.resize((ICON_SIZE, ICON_SIZE), Image.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=ICON_QUALITY, progressive=False, optimize=True)
+    return buffer.getvalue()
+
+
+def make_thumbnails(icon, sizes=THUMBNAIL_SIZES):
+    """Returns a dict of size -> JPEG thumbnail, each decoded in draft mode for its size.
+
+    Args:
+        icon (bytes): JPEG icon
+        sizes (iterable): Edge lengths in pixels (Default: nrothumbs.THUMBNAIL_SIZES)
+    """
+    thumbnails = {}
+    for size in sizes:
+        buffer = io.BytesIO()
+        decode_icon(icon, size).save(buffer, format="JPEG", quality=THUMBNAIL_QUALITY)
+        thumbnails[size] = buffer.getvalue()
+    return thumbnails
+
+
+def output_paths(directory, digest, sizes=THUMBNAIL_SIZES):
+    """Returns a dict of "icon" or thumbnail size -> output path for an icon digest."""
+    name = os.path.join(digest[:2], digest + ".jpg")
+    paths = {"icon": os.path.join(directory, "icons", name)}
+    for size in sizes:
+        paths[size] = os.path.join(directory, "thumbs", str(size), name)
+    return paths
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with atomic_write(path) as out_file:
+        out_file.write(data)
+
+
+def hash_icon(path):
+    """Reads the icon of an NRO and returns its record with the icon digest (None if the NRO
+    has no icon).
+
+    Args:
+        path (str): Path to the NRO file
+    """
+    record = {"path": path, "icon": None}
+    try:
+        icon = read_icon(path)
+    except OSError as e:
+        record["error"] = str(e)
+        return record
+    if icon is not None:
+        record["icon"] = hashlib.new(ICON_ALGORITHM, icon).hexdigest()
+    return record
+
+
+def render_icon(path, digest, directory, sizes=THUMBNAIL_SIZES):
+    """Writes the normalized icon and thumbnails of one NRO, skipping existing outputs.
+
+    Returns the number of files written.
+
+    Args:
+        path (str): Path to the NRO file
+        digest (str): Digest of its icon from hash_icon()
+        directory (str): Output directory
+        sizes (iterable): Thumbnail edge lengths (Default: nrothumbs.THUMBNAIL_SIZES)
+    """
+    paths = output_paths(directory, digest, sizes)
+    missing = {key: path for key, path in paths.items() if not os.path.exists(path)}
+    if not missing:
+        return 0
+
+    icon = read_icon(path)
+    if icon is None or hashlib.new(ICON_ALGORITHM, icon).hexdigest() != digest:
+        raise ValueError("Icon changed while processing")
+    icon = normalize_icon(icon)
+    thumbnails = make_thumbnails(icon, [size for size in sizes if size in missing])
+    if "icon" in missing:
+        _write(missing["icon"], icon)
+    for size, thumbnail in thumbnails.items():
+        _write(missing[size], thumbnail)
+    return len(missing)
+
+
+def _render_icon(item, directory, sizes):
+    """render_icon for worker processes, returns (digest, written, error)."""
+    path, digest = item
+    try:
+        return digest, render_icon(path, digest, directory, sizes), None
+    except Exception as e:
+        return digest, 0, str(e)
+
+
+def build_icons(paths, directory, sizes=THUMBNAIL_SIZES, workers=None, chunksize=64):
+    """Normalizes the icons of many NROs and renders their thumbnails in a process pool.
+
+    Outputs are stored by icon digest below directory (icons/ and thumbs/<size>/, see
+    output_paths()). All icons are hashed first, then every distinct icon is decoded only
+    once and icons whose outputs already exist are not decoded at all.
+
+    Returns (records, stats). records holds one record per NRO in order: path, icon digest
+    (None without icon) and error if its icon could not be read or decoded. stats counts the
+    distinct icons, the files written and the icons which failed.
+
+    Args:
+        paths (iterable): NRO paths
+        directory (str): Output directory
+        sizes (iterable): Thumbnail edge lengths (Default: nrothumbs.THUMBNAIL_SIZES)
+        workers (int): Number of worker processes (Default: CPU count)
+        chunksize (int): Number of NROs handed to a worker at once (Default: 64)
+    """
+    sizes = tuple(sizes)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        records = list(executor.map(hash_icon, paths, chunksize=chunksize))
+
+        unique = {}
+        for record in records:
+            if record["icon"] is not None:
+                unique.setdefault(record["icon"], record["path"])
+        errors = {}
+        written = 0
+        render = partial(_render_icon, directory=directory, sizes=sizes)
+        for digest, count, error in executor.map(
+            render, [(path, digest) for digest, path in unique.items()], chunksize=chunksize
+        ):
+            written += count
+            if error is not None:
+                errors[digest] = error
+
+    for record in records:
+        if record["icon"] in errors:
+            record["error"] = errors[record["icon"]]
+    return records, {"icons": len(unique), "written": written, "failed": len(errors)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Normalize the icons of many NROs and render thumbnails."
+    )
+    parser.add_argument("paths", nargs="+", help="NRO files or directories")
+    parser.add_argument("-o", "--output", required=True, help="Output directory")
+    parser.add_argument(
+        "--sizes", default=",".join(str(size) for size in THUMBNAIL_SIZES),
+        help="Comma-separated thumbnail sizes (Default: {0})".format(
+            ",".join(str(size) for size in THUMBNAIL_SIZES)
+        ),
+    )
+    parser.add_argument("--workers", type=int, help="Number of worker processes")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    records, stats = build_icons(expand_paths(args.paths), args.output, sizes, args.workers)
+    for record in records:
+        print(json.dumps(record, ensure_ascii=False))
+    sys.stdout.flush()
+    print("{icons} distinct icons, {written} files written, {failed} failed".format(**stats),
+          file=sys.stderr)
+    return 1 if any("error" in record for record in records) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
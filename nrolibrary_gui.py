@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+
+import hashlib
+import os
+import queue
+import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import ImageTk
+
+from nrohelper import POLL_INTERVAL
+from nroscan import MetadataCache
+from nrothumbs import ThumbnailCache, default_cache_dir
+
+ROW_HEIGHT = 72
+THUMBNAIL_SIZE = 64
+
+
+class LibraryView(tk.Toplevel):
+    """Window listing all NROs below a directory with icon, name, author and version.
+
+    The list is virtualized: only the rows currently scrolled into view exist on the canvas,
+    their thumbnails are decoded on worker threads. Metadata comes from nroscan's
+    MetadataCache and thumbnails from a ThumbnailCache, both stored in cache_dir, so
+    reopening a library only has to look at files which changed.
+
+    Args:
+        master (tk.Misc): Parent widget
+        directory (str): Directory to list
+        on_open (callable): Called with the path of a double-clicked NRO
+        cache_dir (str): Directory for the metadata and thumbnail caches
+            (Default: nrothumbs.default_cache_dir())
+    """
+
+    def __init__(self, master, directory, on_open, cache_dir=None):
+        super().__init__(master)
+        self.title("Library: " + directory)
+        self.geometry("600x500")
+        self.directory = directory
+        self.on_open = on_open
+        self.cache_dir = cache_dir or default_cache_dir()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.thumbnails = ThumbnailCache(os.path.join(self.cache_dir, "thumbs"))
+
+        self.records = []
+        # Row index -> (canvas item ids, PhotoImage or None) of all rendered rows
+        self.rows = {}
+        self.visible = range(0)
+        self.requested = set()
+        self.results = queue.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=min(8, (os.cpu_count() or 1) + 2))
+        self.closed = False
+
+        self.status = tk.StringVar(value="Scanning " + directory + "...")
+        tk.Label(self, textvariable=self.status, anchor="w").pack(side="bottom", fill="x")
+        self.scrollbar = tk.Scrollbar(self, orient="vertical", command=self.yview)
+        self.scrollbar.pack(side="right", fill="y")
+        self.canvas = tk.Canvas(
+            self, background="white", highlightthickness=0, yscrollcommand=self.scrollbar.set
+        )
+        self.canvas.pack(side="left", fill="both", expand=True)
+
+        self.canvas.bind("<Configure>", lambda event: self.render())
+        self.canvas.bind("<Double-Button-1>", self.open_row)
+        self.canvas.bind("<MouseWheel>", self.on_mousewheel)
+        self.canvas.bind("<Button-4>", lambda event: self.yview("scroll", -1, "units"))
+        self.canvas.bind("<Button-5>", lambda event: self.yview("scroll", 1, "units"))
+        self.protocol("WM_DELETE_WINDOW", self.close)
+
+        self.executor.submit(self.load_records)
+        self.after(POLL_INTERVAL, self.poll)
+
+    def load_records(self):
+        """Worker thread: refreshes the metadata cache and queues the sorted records."""
+        try:
+            # One cache per directory, refresh() drops everything not found in the walk
+            key = hashlib.sha1(os.path.abspath(self.directory).encode("utf-8", "surrogateescape"))
+            cache = MetadataCache(
+                os.path.join(self.cache_dir, "library-" + key.hexdigest()[:16] + ".sqlite")
+            )
+            try:
+                # Threads: spawned worker processes would re-import the GUI script
+                with ThreadPoolExecutor() as executor:
+                    stats = cache.refresh(self.directory, executor=executor)
+                records = list(cache.records())
+            finally:
+                cache.close()
+        except Exception as e:
+            self.results.put(("error", str(e)))
+            return
+        records.sort(key=lambda record: ((record["name"] or "").casefold(), record["path"]))
+        self.results.put(("records", records, stats))
+
+    def load_thumbnail(self, index, path):
+        """Worker thread: decodes a thumbnail unless its row was scrolled away meanwhile."""
+        if index not in self.visible:
+            self.results.put(("skipped", index))
+            return
+        try:
+            image = self.thumbnails.get(path, THUMBNAIL_SIZE)
+        except Exception:
+            image = None
+        self.results.put(("thumbnail", index, image))
+
+    def poll(self):
+        if self.closed:
+            return
+        while True:
+            try:
+                result = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if result[0] == "records":
+                self.records = result[1]
+                self.status.set("{0} NROs ({1} cached, {2} scanned)".format(
+                    len(self.records), result[2].hits, result[2].misses
+                ))
+                for index in list(self.rows):
+                    self.remove_row(index)
+                self.render()
+            elif result[0] == "thumbnail":
+                self.requested.discard(result[1])
+                self.show_thumbnail(result[1], result[2])
+            elif result[0] == "skipped":
+                self.requested.discard(result[1])
+                if result[1] in self.rows:
+                    # Scrolled back into view before the worker got to it
+                    self.request_thumbnail(result[1])
+            else:
+                self.status.set("Scanning failed: " + result[1])
+        self.after(POLL_INTERVAL, self.poll)
+
+    def yview(self, *args):
+        self.canvas.yview(*args)
+        self.render()
+
+    def on_mousewheel(self, event):
+        # Windows reports multiples of 120, macOS small deltas
+        delta = event.delta // 120 if abs(event.delta) >= 120 else event.delta
+        self.yview("scroll", -delta, "units")
+
+    def render(self):
+        """Creates the rows scrolled into view and removes all others."""
+        width = self.canvas.winfo_width()
+        height = len(self.records) * ROW_HEIGHT
+        self.canvas.configure(
+            scrollregion=(0, 0, width, height), yscrollincrement=ROW_HEIGHT // 3
+        )
+        top = int(self.canvas.canvasy(0))
+        first = max(0, top // ROW_HEIGHT)
+        last = min(len(self.records), (top + self.canvas.winfo_height()) // ROW_HEIGHT + 1)
+        self.visible = range(first, last)
+
+        for index in [index for index in self.rows if index not in self.visible]:
+            self.remove_row(index)
+        for index in self.visible:
+            if index not in self.rows:
+                self.create_row(index, width)
+
+    def create_row(self, index, width):
+        record = self.records[index]
+        y = index * ROW_HEIGHT
+        x = THUMBNAIL_SIZE + 16
+        items = [
+            self.canvas.create_rectangle(
+                0, y, width, y + ROW_HEIGHT, outline="",
+                fill="#f4f4f4" if index % 2 else "white",
+            )
+        ]
+        if record["error"]:
+            items.append(self.canvas.create_text(
+                x, y + 12, anchor="nw", fill="gray", text=os.path.basename(record["path"])
+            ))
+            items.append(self.canvas.create_text(
+                x, y + 32, anchor="nw", fill="red", text=record["error"]
+            ))
+        else:
+            items.append(self.canvas.create_text(
+                x, y + 8, anchor="nw", font=("TkDefaultFont", 11, "bold"),
+                text=record["name"] or os.path.basename(record["path"]),
+            ))
+            items.append(self.canvas.create_text(
+                x, y + 30, anchor="nw", text=record["publisher"] or "Unknown Author"
+            ))
+            items.append(self.canvas.create_text(
+                x, y + 48, anchor="nw", fill="gray",
+                text="{0}  -  {1}".format(record["version"] or "?", record["path"]),
+            ))
+        self.rows[index] = (items, None)
+        if record["icon_size"]:
+            self.request_thumbnail(index)
+
+    def request_thumbnail(self, index):
+        if index not in self.requested:
+            self.requested.add(index)
+            self.executor.submit(self.load_thumbnail, index, self.records[index]["path"])
+
+    def show_thumbnail(self, index, image):
+        if image is None or index not in self.rows:
+            return
+        items, _ = self.rows[index]
+        photo = ImageTk.PhotoImage(image)
+        y = index * ROW_HEIGHT + (ROW_HEIGHT - THUMBNAIL_SIZE) // 2
+        items.append(self.canvas.create_image(8, y, anchor="nw", image=photo))
+        self.rows[index] = (items, photo)
+
+    def remove_row(self, index):
+        items, _ = self.rows.pop(index)
+        self.canvas.delete(*items)
+
+    def open_row(self, event):
+        index = int(self.canvas.canvasy(event.y)) // ROW_HEIGHT
+        if 0 <= index < len(self.records) and not self.records[index]["error"]:
+            self.on_open(self.records[index]["path"])
+
+    def close(self):
+        self.closed = True
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.destroy()
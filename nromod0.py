@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+
+import argparse
+import bisect
+import sys
+import threading
+from collections import OrderedDict, namedtuple
+from functools import partial
+
+from nro import *
+from nrohelper import SEGMENT_NAMES, pread, read_nro_header
+
+# Dynamic section tags, see elf.h
+DT_NULL = 0
+DT_HASH = 4
+DT_STRTAB = 5
+DT_SYMTAB = 6
+DT_STRSZ = 10
+DT_SYMENT = 11
+DT_GNU_HASH = 0x6FFFFEF5
+
+SHN_UNDEF = 0
+STT_NAMES = {0: "notype", 1: "object", 2: "func", 3: "section", 4: "file", 6: "tls"}
+STB_NAMES = {0: "local", 1: "global", 2: "weak"}
+
+# Symbol indices of this many builds are kept by load_symbols()
+SYMBOL_CACHE_SIZE = 32
+
+
+class Elf64Dyn(LittleEndianStructure):
+    """Entry of the dynamic section."""
+    _pack_ = 1
+    _fields_ = [
+        ("tag", c_int64),
+        ("value", c_uint64)
+    ]
+
+
+class Elf64Sym(LittleEndianStructure):
+    """Entry of .dynsym."""
+    _pack_ = 1
+    _fields_ = [
+        ("name", c_uint32),
+        ("info", c_uint8),
+        ("other", c_uint8),
+        ("shndx", c_uint16),
+        ("value", c_uint64),
+        ("size", c_uint64)
+    ]
+
+
+Symbol = namedtuple("Symbol", ["name", "address", "size", "type", "bind"])
+
+
+class MOD0Reader:
+    """Reads the MOD0 header, dynamic section and dynamic symbols of an NRO.
+
+    Addresses are offsets into the loaded module, which for NROs equal the file offsets of
+    the text, ro and data segments. Everything is read on first use.
+
+    Args:
+        f (str or file): Path to the NRO file or a seekable file object (not closed by close())
+    """
+
+    def __init__(self, f):
+        self._owned = not hasattr(f, "read")
+        self.fp = open(f, "rb") if self._owned else f
+        try:
+            self.nro = read_nro_header(self.fp)
+            self.mod0_offset = self.nro.start.mod0_offset
+            self.mod0 = MOD0.from_buffer_copy(self.read(self.mod0_offset, sizeof(MOD0)))
+            if self.mod0.magic != MOD0HEADERMAGIC:
+                raise ValueError("MOD0 magic is wrong, should be 'MOD0'")
+        except BaseException:
+            self.close()
+            raise
+        self._dynamic = None
+        self._symbols = None
+
+    @property
+    def build_id(self):
+        return bytes(self.nro.header.build_id)
+
+    def read(self, address, size):
+        """Reads size bytes at a module address, which must lie within one segment."""
+        for name, segment in zip(SEGMENT_NAMES, self.nro.header.segmentHeader):
+            if segment.offset <= address and address + size <= segment.offset + segment.size:
+                data = pread(self.fp, size, address)
+                if len(data) != size:
+                    raise EOFError("{0} segment is truncated".format(name))
+                return data
+        raise ValueError("Range {0:#x}-{1:#x} is not backed by a segment".format(
+            address, address + size
+        ))
+
+    def dynamic(self):
+        """Returns the dynamic section as dict of tag -> list of values."""
+        if self._dynamic is None:
+            dynamic = {}
+            address = self.mod0_offset + self.mod0.dynamicOffset
+            while True:
+                entry = Elf64Dyn.from_buffer_copy(self.read(address, sizeof(Elf64Dyn)))
+                if entry.tag == DT_NULL:
+                    break
+                dynamic.setdefault(entry.tag, []).append(entry.value)
+                address += sizeof(Elf64Dyn)
+            self._dynamic = dynamic
+        return self._dynamic
+
+    def _symbol_count(self, dynamic):
+        if DT_HASH in dynamic:
+            # nbucket, nchain - there is one chain entry per symbol
+            return int.from_bytes(self.read(dynamic[DT_HASH][0] + 4, 4), "little")
+        if DT_GNU_HASH in dynamic:
+            return self._gnu_hash_symbol_count(dynamic[DT_GNU_HASH][0])
+        # .dynstr usually directly follows .dynsym
+        syment = dynamic.get(DT_SYMENT, [sizeof(Elf64Sym)])[0]
+        return max(0, dynamic[DT_STRTAB][0] - dynamic[DT_SYMTAB][0]) // syment
+
+    def _gnu_hash_symbol_count(self, address):
+        header = self.read(address, 16)
+        nbuckets, symoffset, bloom_size = (
+            int.from_bytes(header[i:i + 4], "little") for i in range(0, 12, 4)
+        )
+        buckets_address = address + 16 + bloom_size * 8
+        buckets = self.read(buckets_address, nbuckets * 4)
+        last = max(
+            (int.from_bytes(buckets[i:i + 4], "little") for i in range(0, len(buckets), 4)),
+            default=0,
+        )
+        if last < symoffset:
+            return symoffset
+        # Follow the chain of the highest bucket until its end marker (lowest bit set)
+        chain_address = buckets_address + nbuckets * 4
+        while not int.from_bytes(
+            self.read(chain_address + (last - symoffset) * 4, 4), "little"
+        ) & 1:
+            last += 1
+        return last + 1
+
+    def symbol_tables(self):
+        """Returns the raw .dynsym and .dynstr contents and the symbol entry size for
+        parse_symbols()."""
+        dynamic = self.dynamic()
+        syment = dynamic.get(DT_SYMENT, [sizeof(Elf64Sym)])[0]
+        if DT_SYMTAB not in dynamic or DT_STRTAB not in dynamic:
+            return b"", b"", syment
+        strsz = dynamic.get(DT_STRSZ, [0])[0]
+        count = self._symbol_count(dynamic)
+        table = self.read(dynamic[DT_SYMTAB][0], count * syment) if count else b""
+        strings = self.read(dynamic[DT_STRTAB][0], strsz) if strsz else b""
+        return table, strings, syment
+
+    def symbols(self):
+        """Returns all dynamic symbols as list of Symbol."""
+        if self._symbols is None:
+            self._symbols = parse_symbols(*self.symbol_tables())
+        return self._symbols
+
+    def close(self):
+        if self._owned and self.fp is not None:
+            self.fp.close()
+        self.fp = None
+
+
+def parse_symbols(table, strings, syment=sizeof(Elf64Sym)):
+    """Decodes .dynsym entries into a list of Symbol, skipping the null symbol.
+
+    Args:
+        table (bytes): Contents of .dynsym
+        strings (bytes): Contents of .dynstr
+        syment (int): Size of one .dynsym entry (Default: sizeof(Elf64Sym))
+    """
+    symbols = []
+    for i in range(len(table) // syment):
+        entry = Elf64Sym.from_buffer_copy(table, i * syment)
+        if entry.shndx == SHN_UNDEF and entry.name == 0:
+            # Null symbol
+            continue
+        end = strings.find(b"\x00", entry.name)
+        name = strings[entry.name:end if end >= 0 else None]
+        symbols.append(Symbol(
+            name.decode("utf-8", "replace"),
+            entry.value,
+            entry.size,
+            STT_NAMES.get(entry.info & 0xF, entry.info & 0xF),
+            STB_NAMES.get(entry.info >> 4, entry.info >> 4),
+        ))
+    return symbols
+
+
+class SymbolIndex:
+    """Address -> symbol lookup over the defined symbols of a module.
+
+    The index is built on the first lookup: a sorted list of start addresses searched
+    with bisect. Symbols given as a callable are only loaded then as well.
+
+    Args:
+        symbols (list or callable): Symbols, e.g. from MOD0Reader.symbols(), or a callable
+            returning them
+    """
+
+    def __init__(self, symbols):
+        self._load = symbols if callable(symbols) else lambda: symbols
+        self._all = None
+        self._addresses = None
+        self._symbols = None
+        self._lock = threading.Lock()
+
+    def _build(self):
+        with self._lock:
+            if self._addresses is not None:
+                return
+            self._all = self._load()
+            self._load = None
+            defined = sorted(
+                (symbol for symbol in self._all
+                 if symbol.address and symbol.type not in ("section", "file", "tls")),
+                key=lambda symbol: (symbol.address, -symbol.size),
+            )
+            self._symbols = defined
+            self._addresses = [symbol.address for symbol in defined]
+
+    def lookup(self, address):
+        """Returns (symbol, offset into it) of the symbol containing address, or None.
+
+        Symbols without a size match every address up to the next symbol.
+        """
+        if self._addresses is None:
+            self._build()
+        i = bisect.bisect_right(self._addresses, address) - 1
+        if i < 0:
+            return None
+        symbol = self._symbols[i]
+        offset = address - symbol.address
+        if symbol.size and offset >= symbol.size:
+            return None
+        return symbol, offset
+
+    def __len__(self):
+        if self._addresses is None:
+            self._build()
+        return len(self._all)
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def load_symbols(f):
+    """Returns the SymbolIndex of an NRO, cached by build ID.
+
+    The build ID is looked up before MOD0 is read, so repeated calls for NROs with an already
+    seen build ID only read the NRO header. On a miss the symbol tables are read, but only
+    decoded on the first lookup. NROs with an all-zero build ID are never cached.
+
+    Args:
+        f (str or file): Path to the NRO file or a seekable file object
+    """
+    owned = not hasattr(f, "read")
+    fp = open(f, "rb") if owned else f
+    try:
+        build_id = bytes(read_nro_header(fp).header.build_id)
+        cacheable = any(build_id)
+        if cacheable:
+            with _cache_lock:
+                index = _cache.get(build_id)
+                if index is not None:
+                    _cache.move_to_end(build_id)
+                    return index
+        reader = MOD0Reader(fp)
+        try:
+            tables = reader.symbol_tables()
+        finally:
+            reader.close()
+    finally:
+        if owned:
+            fp.close()
+
+    index = SymbolIndex(partial(parse_symbols, *tables))
+    if cacheable:
+        with _cache_lock:
+            _cache[build_id] = index
+            while len(_cache) > SYMBOL_CACHE_SIZE:
+                _cache.popitem(last=False)
+    return index
+
+
+def format_address(index, address):
+    """Formats address as "symbol+0x10" or as hex if no symbol contains it."""
+    match = index.lookup(address)
+    if match is None:
+        return "{0:#x}".format(address)
+    symbol, offset = match
+    return "{0}+{1:#x}".format(symbol.name, offset) if offset else symbol.name
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Resolve addresses in an NRO to dynamic symbols via MOD0."
+    )
+    parser.add_argument("file", help="NRO file")
+    parser.add_argument("addresses", nargs="*", help="Module offsets, e.g. 0x1234")
+    parser.add_argument("--list", action="store_true", help="List all dynamic symbols")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        reader = MOD0Reader(args.file)
+        try:
+            for symbol in reader.symbols():
+                print("{0.address:016x} {0.size:8x} {0.type:<7} {0.bind:<6} {0.name}"
+                      .format(symbol))
+        finally:
+            reader.close()
+
+    if args.addresses:
+        index = load_symbols(args.file)
+        for address in args.addresses:
+            address = int(address, 0)
+            print("{0:#x} {1}".format(address, format_address(index, address)))
+    sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from nro import *
+from nrohelper import IO_WORKERS, NoAssetsError, read_headers
+from nroscan import expand_paths
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+LANGUAGES = (
+    "AmericanEnglish", "BritishEnglish", "Japanese", "French", "German", "LatinAmericanSpanish",
+    "Spanish", "Italian", "Dutch", "CanadianFrench", "Portuguese", "Russian", "Korean",
+    "TraditionalChinese", "SimplifiedChinese", "BrazilianPortuguese",
+)
+# c_byte arrays holding NUL-padded text, mapped to numpy bytes instead of int8 arrays
+STRING_FIELDS = frozenset(("name", "publisher", "isbn", "displayVersion", "bcatPassphrase"))
+
+_dtype_cache = {}
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("Columnar NACP decoding requires NumPy: pip install numpy")
+
+
+def ctypes_dtype(ctype, name=None):
+    """Returns the numpy dtype mirroring a ctypes type, structures are mapped field by field.
+
+    Args:
+        ctype (type): ctypes simple type, array or (packed) LittleEndianStructure
+        name (str): Field name, used to detect STRING_FIELDS
+    """
+    _require_numpy()
+    if issubclass(ctype, Structure):
+        fields = [(field, ctypes_dtype(field_type, field)) for field, field_type in ctype._fields_]
+        dtype = np.dtype(fields)
+        if dtype.itemsize != sizeof(ctype):
+            raise ValueError("{0} is not packed, dtype would not match".format(ctype.__name__))
+        return dtype
+    if issubclass(ctype, Array):
+        if name in STRING_FIELDS and sizeof(ctype._type_) == 1:
+            return np.dtype("S{0}".format(ctype._length_))
+        return np.dtype((ctypes_dtype(ctype._type_), (ctype._length_,)))
+    if ctype._type_ == "c":
+        return np.dtype("S1")
+    kind = "i" if ctype._type_.islower() else "u"
+    return np.dtype("<{0}{1}".format(kind, sizeof(ctype)))
+
+
+def nacp_dtype():
+    """Returns the structured dtype of a NACP, built once from NACP._fields_."""
+    dtype = _dtype_cache.get(NACP)
+    if dtype is None:
+        dtype = _dtype_cache[NACP] = ctypes_dtype(NACP)
+    return dtype
+
+
+def _read_nacp_into(path, row):
+    """Reads the NACP of an NRO straight into row (a writable buffer). Returns an error or None."""
+    try:
+        with open(path, "rb", buffering=0) as fp:
+            nro, asset = read_headers(fp)
+            if asset is None:
+                return str(NoAssetsError())
+            if asset.nacp.size < sizeof(NACP):
+                return "NACP is missing or too small"
+            fp.seek(nro.header.size + asset.nacp.offset)
+            if fp.readinto(row) != sizeof(NACP):
+                return "Unexpected end of file"
+    except (OSError, ValueError) as e:
+        return str(e)
+    return None
+
+
+class NACPTable:
+    """Many NACPs decoded into a NumPy structured array for bulk analytics.
+
+    Every field of NACP is a column, e.g. table.data["saveDataOwnerId"] is a uint64 array and
+    table.data["title"]["name"] a (rows, 16) bytes array. Rows which could not be read are
+    zeroed and marked in errors.
+
+    Args:
+        data (numpy.ndarray): Structured array with nacp_dtype()
+        paths (list): Source path of every row (Default: None)
+        errors (list): Error message or None for every row (Default: None)
+    """
+
+    def __init__(self, data, paths=None, errors=None):
+        _require_numpy()
+        self.data = data
+        self.paths = paths if paths is not None else [None] * len(data)
+        self.errors = errors if errors is not None else [None] * len(data)
+
+    @classmethod
+    def from_blobs(cls, blobs):
+        """Builds a table from raw NACP blobs (bytes-like, at least 0x4000 bytes each)."""
+        dtype = nacp_dtype()
+        blobs = list(blobs)
+        data = np.empty(len(blobs), dtype=dtype)
+        raw = data.view(np.uint8).reshape(len(blobs), dtype.itemsize)
+        for i, blob in enumerate(blobs):
+            raw[i] = np.frombuffer(blob, dtype=np.uint8, count=dtype.itemsize)
+        return cls(data)
+
+    @classmethod
+    def from_paths(cls, paths, workers=None):
+        """Reads the NACPs of many NROs (directories are walked) in a thread pool.
+
+        Each NACP is read directly into its row of the array, no intermediate objects are
+        created.
+
+        Args:
+            paths (iterable): NRO files or directories
+            workers (int): Number of threads (Default: 2 * CPU count)
+        """
+        paths = list(expand_paths(paths))
+        data = np.zeros(len(paths), dtype=nacp_dtype())
+        raw = data.view(np.uint8).reshape(len(paths), data.dtype.itemsize)
+
+        workers = workers or IO_WORKERS
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            errors = list(executor.map(
+                lambda i: _read_nacp_into(paths[i], memoryview(raw[i])), range(len(paths))
+            ))
+        for i, error in enumerate(errors):
+            if error is not None:
+                raw[i] = 0
+        return cls(data, paths, errors)
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def valid(self):
+        """Boolean mask of rows which were read successfully."""
+        return np.array([error is None for error in self.errors], dtype=bool)
+
+    def column(self, name):
+        """Returns a field as array, e.g. "supportedLanguages" or "saveDataOwnerId"."""
+        return self.data[name]
+
+    @staticmethod
+    def _decode(column):
+        return np.char.decode(column, "utf-8", "replace")
+
+    def names(self, language=None):
+        """Returns decoded names as str array, (rows,) for one language or (rows, 16) for all.
+
+        Args:
+            language (int): Title entry index, see LANGUAGES (Default: all languages)
+        """
+        names = self.data["title"]["name"]
+        return self._decode(names if language is None else names[:, language])
+
+    def publishers(self, language=None):
+        """Like names(), for publishers."""
+        publishers = self.data["title"]["publisher"]
+        return self._decode(publishers if language is None else publishers[:, language])
+
+    def display_versions(self):
+        """Returns decoded display versions as str array."""
+        return self._decode(self.data["displayVersion"])
+
+    def supported_languages(self):
+        """Returns a (rows, 16) boolean matrix of the supportedLanguages bit flags."""
+        flags = self.data["supportedLanguages"]
+        return (flags[:, None] >> np.arange(len(LANGUAGES), dtype=flags.dtype)) & 1 == 1
+
+    def has_title(self):
+        """Returns a (rows, 16) boolean matrix of title entries with a name set."""
+        return self.data["title"]["name"] != b""
+
+    def summary(self):
+        """Returns per-language and per-version counts over all valid rows."""
+        valid = self.valid
+        versions, counts = np.unique(self.display_versions()[valid], return_counts=True)
+        return {
+            "nros": int(valid.sum()),
+            "errors": int(len(self) - valid.sum()),
+            "titles": dict(zip(LANGUAGES, self.has_title()[valid].sum(axis=0).tolist())),
+            "supported_languages": dict(
+                zip(LANGUAGES, self.supported_languages()[valid].sum(axis=0).tolist())
+            ),
+            "display_versions": dict(zip(versions.tolist(), counts.tolist())),
+        }
+
+    def save(self, path):
+        """Saves data, paths and errors as .npz for later analysis."""
+        np.savez(
+            path, nacp=self.data, paths=np.array(self.paths, dtype=str),
+            errors=np.array(["" if e is None else e for e in self.errors], dtype=str),
+        )
+
+    @classmethod
+    def load(cls, path):
+        """Loads a table written by save()."""
+        _require_numpy()
+        with np.load(path) as archive:
+            data = archive["nacp"]
+            paths = archive["paths"].tolist()
+            errors = [error or None for error in archive["errors"].tolist()]
+        return cls(data, paths, errors)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Decode the NACPs of many NROs into a NumPy array and summarize them."
+    )
+    parser.add_argument("paths", nargs="+", help="NRO files or directories")
+    parser.add_argument("--workers", type=int, help="Number of threads")
+    parser.add_argument("--save", help="Save the table as .npz to this file")
+    args = parser.parse_args(argv)
+
+    table = NACPTable.from_paths(args.paths, args.workers)
+    for path, error in zip(table.paths, table.errors):
+        if error is not None:
+            print("{0}: {1}".format(path, error), file=sys.stderr)
+    if args.save:
+        table.save(args.save)
+    json.dump(table.summary(), sys.stdout, ensure_ascii=False, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+
+from nro import *
+from nrohelper import ASSET_NAMES, atomic_write, copy_range, file_size, read_headers
+from romfs import RomFSBuilder, build_romfs
+
+
+def _section(name, value, src_fp, nro, asset):
+    """Returns (size, write function) for one asset section.
+
+    value is None to keep the section of the source NRO, bytes-like data, an NACP, a path to
+    a file or (for the RomFS) a directory or RomFSBuilder.
+    """
+    if value is None:
+        if asset is None:
+            return 0, None
+        section = getattr(asset, name)
+        start = nro.header.size + section.offset
+        return section.size, lambda dst: copy_range(src_fp, start, section.size, dst)
+    if isinstance(value, RomFSBuilder):
+        return value.size, value.write
+    if isinstance(value, NACP):
+        value = bytes(value)
+    if isinstance(value, str):
+        if name == "romfs" and os.path.isdir(value):
+            builder = RomFSBuilder(value)
+            return builder.size, builder.write
+        size = os.path.getsize(value)
+
+        def write_file(dst):
+            with open(value, "rb") as section_file:
+                copy_range(section_file, 0, size, dst)
+
+        return size, write_file
+    value = bytes(value)
+    if name == "nacp" and value and len(value) != sizeof(NACP):
+        raise ValueError("NACP must be {0:#x} bytes".format(sizeof(NACP)))
+    return len(value), lambda dst: dst.write(value)
+
+
+def write_assets(path, output=None, icon=None, nacp=None, romfs=None):
+    """Writes an NRO with a new or replaced asset section.
+
+    Works on NROs with and without an existing asset section. The NRO image and all kept
+    sections are copied with copy_range and a RomFS directory is packed while it is written,
+    so no section is ever held in memory. output is replaced atomically and may be path.
+
+    Args:
+        path (str): Source NRO
+        output (str): Output path (Default: path)
+        icon: New icon (JPEG bytes or path), b"" to remove it (Default: keep)
+        nacp: New NACP (NACP, bytes or path), b"" to remove it (Default: keep)
+        romfs: New RomFS (image path, directory, RomFSBuilder or bytes), b"" to remove it
+            (Default: keep)
+    """
+    output = output or path
+    with open(path, "rb") as src_fp:
+        nro, existing = read_headers(src_fp)
+        if nro.header.size > file_size(src_fp):
+            raise ValueError("NRO is truncated")
+
+        values = {"icon": icon, "nacp": nacp, "romfs": romfs}
+        sections = {
+            name: _section(name, values[name], src_fp, nro, existing) for name in ASSET_NAMES
+        }
+
+        # Same layout as elf2nro: header, icon, NACP, RomFS back to back
+        asset = Asset()
+        asset.magic = ASSETHEADERMAGIC
+        offset = sizeof(Asset)
+        for name in ASSET_NAMES:
+            section = getattr(asset, name)
+            section.offset = offset
+            section.size = sections[name][0]
+            offset += section.size
+
+        with atomic_write(output, mode_from=path) as out_fp:
+            copy_range(src_fp, 0, nro.header.size, out_fp)
+            out_fp.write(bytes(asset))
+            for name in ASSET_NAMES:
+                size, write = sections[name]
+                if size:
+                    write(out_fp)
+            if out_fp.tell() != nro.header.size + offset:
+                raise RuntimeError("Asset section size changed while writing")
+            # output may be path, which Windows can't replace while it is open
+            src_fp.close()
+    return asset
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build RomFS images and NRO asset sections.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    romfs_parser = subparsers.add_parser("romfs", help="Pack a directory into a RomFS image")
+    romfs_parser.add_argument("directory", help="Root directory of the RomFS")
+    romfs_parser.add_argument("output", help="Output RomFS image")
+
+    assets_parser = subparsers.add_parser(
+        "assets", help="Add or replace icon, NACP and RomFS of an NRO"
+    )
+    assets_parser.add_argument("nro", help="Source NRO (with or without assets)")
+    assets_parser.add_argument("-o", "--output", help="Output NRO (Default: modify in place)")
+    assets_parser.add_argument("--icon", help="JPEG icon")
+    assets_parser.add_argument("--nacp", help="NACP file")
+    assets_parser.add_argument("--romfs", help="RomFS image or directory to pack")
+    for name in ASSET_NAMES:
+        assets_parser.add_argument(
+            "--no-" + name, action="store_true", help="Remove the {0}".format(name)
+        )
+
+    args = parser.parse_args(argv)
+
+    if args.command == "romfs":
+        build_romfs(args.directory, args.output)
+    else:
+        write_assets(
+            args.nro, args.output,
+            icon=b"" if args.no_icon else args.icon,
+            nacp=b"" if args.no_nacp else args.nacp,
+            romfs=b"" if args.no_romfs else args.romfs,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from nro import *
+from nrohelper import file_identity, pread, read_headers
+from nrotrace import NULL_TRACER, Tracer
+
+CATALOG_COLUMNS = [
+    ("path", "TEXT PRIMARY KEY"),
+    ("file_size", "INTEGER"),
+    ("name", "TEXT"),
+    ("publisher", "TEXT"),
+    ("version", "TEXT"),
+    ("build_id", "TEXT"),
+    ("text_size", "INTEGER"),
+    ("ro_size", "INTEGER"),
+    ("data_size", "INTEGER"),
+    ("bss_size", "INTEGER"),
+    ("icon_size", "INTEGER"),
+    ("nacp_size", "INTEGER"),
+    ("romfs_size", "INTEGER"),
+    ("error", "TEXT"),
+]
+
+
+CacheStats = namedtuple("CacheStats", ["hits", "misses", "evictions"])
+
+
+def find_nros(directory, extension=".nro"):
+    """Yields paths of all NRO files below directory.
+
+    Args:
+        directory (str): Directory to walk
+        extension (str): File extension to match, case-insensitive (Default: ".nro")
+    """
+    for entry in find_nro_entries(directory, extension):
+        yield entry.path
+
+
+def find_nro_entries(directory, extension=".nro"):
+    """Like find_nros, but yields os.DirEntry objects so callers get stat data for free."""
+    stack = [directory]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.lower().endswith(extension) and entry.is_file():
+                    yield entry
+
+
+def expand_paths(paths):
+    """Yields NRO paths, directories are walked recursively."""
+    for path in paths:
+        if os.path.isdir(path):
+            yield from find_nros(path)
+        else:
+            yield path
+
+
+def new_record(path):
+    """Returns an empty catalog record."""
+    record = dict.fromkeys(name for name, _ in CATALOG_COLUMNS)
+    record["path"] = path
+    return record
+
+
+def fill_record(record, nro=None, asset=None, nacp=None):
+    """Fills a catalog record from parsed structures."""
+    if nro is not None:
+        record["build_id"] = bytes(nro.header.build_id).hex()
+        record["text_size"] = nro.header.segmentHeader[0].size
+        record["ro_size"] = nro.header.segmentHeader[1].size
+        record["data_size"] = nro.header.segmentHeader[2].size
+        record["bss_size"] = nro.header.bssSize
+    if asset is not None:
+        record["icon_size"] = asset.icon.size
+        record["nacp_size"] = asset.nacp.size
+        record["romfs_size"] = asset.romfs.size
+    if nacp is not None:
+        record["name"] = nacp.title[0].get_name()
+        record["publisher"] = nacp.title[0].get_publisher()
+        record["version"] = nacp.get_version()
+    return record
+
+
+def read_metadata(path, tracer=None):
+    """Reads the catalog record of a single NRO.
+
+    Only the NRO header, the asset header and the NACP are read - segments, icon and RomFS
+    are never touched.
+
+    Args:
+        path (str): Path to the NRO file
+        tracer (nrotrace.Tracer): Records operation timings and I/O counts (Default: disabled)
+    """
+    tracer = tracer or NULL_TRACER
+    record = new_record(path)
+    try:
+        with open(path, "rb", buffering=0) as raw_fp:
+            fp = tracer.wrap(raw_fp)
+            record["file_size"] = os.fstat(fp.fileno()).st_size
+
+            with tracer.span("header"):
+                nro, asset = read_headers(fp)
+                fill_record(record, nro=nro)
+                if asset is None:
+                    raise ValueError("NRO has no Assets section")
+                fill_record(record, asset=asset)
+
+            if asset.nacp.size >= sizeof(NACP):
+                with tracer.span("nacp_decode"):
+                    data = pread(fp, sizeof(NACP), nro.header.size + asset.nacp.offset)
+                    if len(data) < sizeof(NACP):
+                        raise ValueError("NACP is truncated")
+                    fill_record(record, nacp=NACP.from_buffer_copy(data))
+    except (OSError, ValueError) as e:
+        record["error"] = str(e)
+    return record
+
+
+def _read_metadata_traced(path):
+    """read_metadata for worker processes, returns the record and the tracer state."""
+    tracer = Tracer()
+    record = read_metadata(path, tracer)
+    return record, tracer.state()
+
+
+def _map_metadata(executor, paths, chunksize, tracer):
+    if tracer is None or not tracer.enabled:
+        yield from executor.map(read_metadata, paths, chunksize=chunksize)
+        return
+    for record, state in executor.map(_read_metadata_traced, paths, chunksize=chunksize):
+        tracer.merge(state)
+        yield record
+
+
+def scan(directory, workers=None, chunksize=64, tracer=None):
+    """Parses all NROs below directory in a process pool and yields their catalog records.
+
+    Args:
+        directory (str): Directory to walk
+        workers (int): Number of worker processes (Default: CPU count)
+        chunksize (int): Number of paths handed to a worker at once (Default: 64)
+        tracer (nrotrace.Tracer): Collects the workers' timings and I/O counts
+    """
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        with (tracer or NULL_TRACER).span("scan"):
+            yield from _map_metadata(executor, find_nros(directory), chunksize, tracer)
+
+
+class MetadataCache:
+    """Persistent catalog cache for incremental re-indexing of a directory.
+
+    Records are keyed on the file path and validated against its size, mtime and inode, so
+    unchanged files are never opened again.
+
+    Args:
+        path (str): Path to the SQLite cache file
+    """
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER, record TEXT)"
+        )
+
+    def refresh(self, directory, workers=None, chunksize=64, tracer=None, executor=None):
+        """Brings the cache in sync with directory and returns CacheStats.
+
+        Unchanged files are hits, new or modified files are reparsed in a process pool
+        (misses) and files which no longer exist are dropped (evictions).
+
+        Args:
+            directory (str): Directory to walk
+            workers (int): Number of worker processes (Default: CPU count)
+            chunksize (int): Number of paths handed to a worker at once (Default: 64)
+            tracer (nrotrace.Tracer): Collects the workers' timings and I/O counts
+            executor (concurrent.futures.Executor): Parses with this executor instead of a
+                new process pool, e.g. a thread pool in GUIs which can't be re-imported by
+                spawned processes
+        """
+        known = {
+            path: (size, mtime_ns, inode)
+            for path, size, mtime_ns, inode in self.db.execute(
+                "SELECT path, size, mtime_ns, inode FROM cache"
+            )
+        }
+
+        hits = 0
+        misses = {}
+        for entry in find_nro_entries(directory):
+            try:
+                # Without the path, which is the key already
+                identity = file_identity(entry)[1:]
+            except OSError:
+                continue
+            if known.pop(entry.path, None) == identity:
+                hits += 1
+            else:
+                misses[entry.path] = identity
+
+        # Everything left in known was not seen during the walk
+        self.db.executemany("DELETE FROM cache WHERE path = ?", ((path,) for path in known))
+
+        if misses and executor is not None:
+            self._store(misses, _map_metadata(executor, misses, chunksize, tracer))
+        elif misses:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                self._store(misses, _map_metadata(executor, misses, chunksize, tracer))
+        self.db.commit()
+
+        return CacheStats(hits, len(misses), len(known))
+
+    def _store(self, misses, records):
+        self.db.executemany(
+            "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)",
+            (
+                (record["path"],) + misses[record["path"]]
+                + (json.dumps(record, ensure_ascii=False),)
+                for record in records
+            ),
+        )
+
+    def records(self):
+        """Yields all cached catalog records."""
+        for (record,) in self.db.execute("SELECT record FROM cache ORDER BY path"):
+            yield json.loads(record)
+
+    def close(self):
+        self.db.close()
+
+
+def write_jsonl(records, fp):
+    """Writes records as JSON lines to fp."""
+    for record in records:
+        fp.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def open_catalog(path):
+    """Opens (and creates if necessary) an SQLite catalog."""
+    db = sqlite3.connect(path)
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS nro ({0})".format(
+            ", ".join("{0} {1}".format(name, kind) for name, kind in CATALOG_COLUMNS)
+        )
+    )
+    return db
+
+
+def write_sqlite(records, db):
+    """Inserts or replaces records in an SQLite catalog."""
+    columns = [name for name, _ in CATALOG_COLUMNS]
+    db.executemany(
+        "INSERT OR REPLACE INTO nro ({0}) VALUES ({1})".format(
+            ", ".join(columns), ", ".join("?" * len(columns))
+        ),
+        ([record[name] for name in columns] for record in records),
+    )
+    db.commit()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index a directory of NROs into a catalog.")
+    parser.add_argument("directory", help="Directory to scan")
+    parser.add_argument("--jsonl", help="Write catalog as JSON lines to this file ('-' for stdout)")
+    parser.add_argument("--sqlite", help="Write catalog to this SQLite database")
+    parser.add_argument("--workers", type=int, help="Number of worker processes")
+    parser.add_argument(
+        "--cache", help="Persistent cache file, only new or modified NROs are reparsed"
+    )
+    parser.add_argument("--trace", help="Write timing histograms and I/O counts to this file")
+    args = parser.parse_args(argv)
+    tracer = Tracer() if args.trace else None
+
+    if args.cache:
+        cache = MetadataCache(args.cache)
+        stats = cache.refresh(args.directory, args.workers, tracer=tracer)
+        records = list(cache.records())
+        cache.close()
+        print(
+            "Cache: {0} hits, {1} misses, {2} evictions".format(*stats),
+            file=sys.stderr,
+        )
+    else:
+        records = list(scan(args.directory, args.workers, tracer=tracer))
+
+    if args.sqlite:
+        db = open_catalog(args.sqlite)
+        write_sqlite(records, db)
+        db.close()
+    if args.jsonl == "-" or not (args.jsonl or args.sqlite):
+        write_jsonl(records, sys.stdout)
+    elif args.jsonl:
+        with open(args.jsonl, "w", encoding="utf-8") as jsonl_file:
+            write_jsonl(records, jsonl_file)
+    if tracer:
+        tracer.export(args.trace)
+
+
+if __name__ == "__main__":
+    main()
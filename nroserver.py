@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from functools import partial
+from stat import S_ISREG
+from urllib.parse import unquote, urlsplit
+
+from nrohelper import IO_WORKERS, NROHelper, file_identity
+from nroscan import fill_record, find_nro_entries, new_record, read_metadata
+
+MAX_HEADER_SIZE = 16 * 1024
+KEEP_ALIVE_TIMEOUT = 15
+STATUS_TEXT = {
+    200: "OK", 206: "Partial Content", 304: "Not Modified", 400: "Bad Request",
+    404: "Not Found", 405: "Method Not Allowed", 416: "Range Not Satisfiable",
+    500: "Internal Server Error",
+}
+
+CacheEntry = namedtuple("CacheEntry", ["record", "icon", "romfs", "etag"])
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message=None):
+        super().__init__(message or STATUS_TEXT[status])
+        self.status = status
+
+
+def parse_range(value, size):
+    """Parses a single "bytes=" range header. Returns (start, end) with end exclusive, None
+    to send the whole body or raises HTTPError(416)."""
+    unit, _, ranges = value.partition("=")
+    if unit.strip() != "bytes" or "," in ranges:
+        # Multipart ranges are not supported, the whole body is always a valid answer
+        return None
+    first, _, last = ranges.strip().partition("-")
+    try:
+        if not first:
+            start, end = max(0, size - int(last)), size
+        else:
+            start = int(first)
+            end = min(size, int(last) + 1) if last else size
+    except ValueError:
+        return None
+    if start >= end:
+        raise HTTPError(416)
+    return start, end
+
+
+class NROServer:
+    """Asyncio HTTP server for the NROs below a directory.
+
+    Routes (paths are relative to the directory):
+        GET /nros               JSON list of all catalog records (see nroscan)
+        GET /nro/<path>         JSON catalog record of one NRO
+        GET /icon/<path>        Icon JPEG
+        GET /romfs/<path>       RomFS image, supports Range requests
+
+    Parsed headers and icons are kept in an LRU keyed on path, size, mtime and inode. The
+    records served by /nros are kept apart from it without a size limit, so listing a library
+    larger than the LRU only reparses new or modified files. File access runs in a thread
+    pool, RomFS downloads use loop.sendfile(). All responses carry an ETag built from size,
+    mtime and build ID and honor If-None-Match.
+
+    Args:
+        directory (str): Library root
+        cache_size (int): Maximum number of NROs in the LRU (Default: 1024)
+        workers (int): Number of threads for file access (Default: 2 * CPU count)
+    """
+
+    def __init__(self, directory, cache_size=1024, workers=None):
+        self.directory = os.path.realpath(directory)
+        self.cache_size = cache_size
+        workers = workers or IO_WORKERS
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self._cache = OrderedDict()
+        # Loads in flight, so concurrent requests for the same NRO parse it only once
+        self._pending = {}
+        # path -> (identity, record) of every NRO seen by list_nros()
+        self._records = {}
+        self._listing = asyncio.Lock()
+        # Bounds the parse jobs a listing queues on the executor at once
+        self._parsing = asyncio.Semaphore(workers)
+
+    def resolve(self, relpath):
+        """Maps a request path to a file inside the directory, raises HTTPError(404).
+
+        Resolving symlinks touches the filesystem, so this runs in the thread pool.
+        """
+        path = os.path.realpath(os.path.join(self.directory, relpath.lstrip("/")))
+        if os.path.commonpath([self.directory, path]) != self.directory:
+            raise HTTPError(404)
+        return path
+
+    def _stat(self, relpath):
+        """Thread pool: resolves a request path, returns its path and stat of a regular file."""
+        path = self.resolve(relpath)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            raise HTTPError(404)
+        if not S_ISREG(stat.st_mode):
+            raise HTTPError(404)
+        return path, stat
+
+    def _load(self, path, relpath):
+        """Thread pool: parses an NRO, returns its identity and CacheEntry."""
+        record = new_record(relpath)
+        icon = None
+        romfs = (0, 0)
+        try:
+            nro_file = open(path, "rb")
+        except OSError:
+            raise HTTPError(404)
+        with nro_file:
+            stat = os.fstat(nro_file.fileno())
+            identity = file_identity(path, stat)
+            record["file_size"] = stat.st_size
+            try:
+                nro = NROHelper(nro_file, lazy=True)
+                try:
+                    fill_record(record, nro.nro, nro.asset, nro.nacp)
+                    icon = bytes(nro.icon) if nro.asset.icon.size else None
+                    romfs = (nro.nro.header.size + nro.asset.romfs.offset, nro.asset.romfs.size)
+                finally:
+                    nro.close()
+            except Exception as e:
+                # Broken NROs are cached as well, their record carries the error
+                record["error"] = str(e)
+
+        etag = '"{0:x}-{1:x}-{2}"'.format(
+            stat.st_size, stat.st_mtime_ns, (record["build_id"] or "")[:16]
+        )
+        return identity, CacheEntry(record, icon, romfs, etag)
+
+    def _loaded(self, identity, future):
+        """Stores a finished load in the LRU, whether or not anyone still waits for it."""
+        del self._pending[identity]
+        if future.cancelled() or future.exception() is not None:
+            return
+        loaded_identity, entry = future.result()
+        self._cache[loaded_identity] = entry
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def entry(self, relpath):
+        """Returns the CacheEntry of an NRO, parsing it in the thread pool on a miss."""
+        loop = asyncio.get_running_loop()
+        path, stat = await loop.run_in_executor(self.executor, self._stat, relpath)
+        identity = file_identity(path, stat)
+
+        entry = self._cache.get(identity)
+        if entry is not None:
+            self._cache.move_to_end(identity)
+            return entry
+
+        future = self._pending.get(identity)
+        if future is None:
+            future = loop.run_in_executor(self.executor, self._load, path, relpath)
+            self._pending[identity] = future
+            future.add_done_callback(partial(self._loaded, identity))
+        # A client disconnecting must not cancel the load for everyone else waiting on it
+        return (await asyncio.shield(future))[1]
+
+    def _walk(self):
+        """Thread pool: returns (path, identity) of all NROs below the directory."""
+        nros = []
+        for entry in find_nro_entries(self.directory):
+            try:
+                nros.append((entry.path, file_identity(entry)))
+            except OSError:
+                # Deleted during the walk
+                continue
+        return sorted(nros)
+
+    async def _parse_record(self, path, identity):
+        loop = asyncio.get_running_loop()
+        async with self._parsing:
+            record = await loop.run_in_executor(self.executor, read_metadata, path)
+        record["path"] = os.path.relpath(path, self.directory).replace(os.sep, "/")
+        self._records[path] = (identity, record)
+
+    async def list_nros(self):
+        """Returns the catalog records of all NROs, reparsing only new or modified files."""
+        loop = asyncio.get_running_loop()
+        # Concurrent listings wait for the first one and then find everything up to date
+        async with self._listing:
+            nros = await loop.run_in_executor(self.executor, self._walk)
+            await asyncio.gather(*(
+                self._parse_record(path, identity) for path, identity in nros
+                if self._records.get(path, (None,))[0] != identity
+            ))
+            seen = {path for path, _ in nros}
+            for path in [path for path in self._records if path not in seen]:
+                del self._records[path]
+            return [self._records[path][1] for path, _ in nros]
+
+    async def handle(self, reader, writer):
+        """Serves one connection, with keep-alive."""
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(
+                        reader.readuntil(b"\r\n\r\n"), KEEP_ALIVE_TIMEOUT
+                    )
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError,
+                        asyncio.LimitOverrunError, ConnectionError):
+                    break
+                try:
+                    keep_alive = await self.respond(head, reader, writer)
+                except ConnectionError:
+                    break
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+
+    async def respond(self, head, reader, writer):
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, version = lines[0].split(" ")
+        except ValueError:
+            await self.send(writer, 400, b"Bad Request", keep_alive=False)
+            return False
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            if name:
+                headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get("content-length") or 0)
+            if length < 0:
+                raise ValueError("Negative Content-Length")
+            if length:
+                await reader.readexactly(length)
+        except (ValueError, asyncio.IncompleteReadError):
+            # Malformed Content-Length or the body ended early
+            await self.send(writer, 400, b"Bad Request", keep_alive=False)
+            return False
+        connection = headers.get("connection", "").lower()
+        keep_alive = connection == "keep-alive" if version == "HTTP/1.0" else connection != "close"
+
+        try:
+            if method not in ("GET", "HEAD"):
+                raise HTTPError(405)
+            await self.route(unquote(urlsplit(target).path), headers, writer, method, keep_alive)
+        except HTTPError as e:
+            await self.send(writer, e.status, str(e).encode(), keep_alive=keep_alive,
+                            head_only=method == "HEAD")
+        except (ConnectionError, asyncio.CancelledError):
+            return False
+        except Exception as e:
+            print("{0} {1}: {2!r}".format(method, target, e), file=sys.stderr)
+            await self.send(writer, 500, b"Internal Server Error", keep_alive=False)
+            return False
+        return keep_alive
+
+    async def route(self, path, headers, writer, method, keep_alive):
+        head_only = method == "HEAD"
+        if path == "/nros":
+            body = json.dumps(await self.list_nros(), ensure_ascii=False).encode()
+            await self.send(writer, 200, body, "application/json", keep_alive=keep_alive,
+                            head_only=head_only)
+            return
+
+        kind, _, relpath = path.lstrip("/").partition("/")
+        if kind not in ("nro", "icon", "romfs") or not relpath:
+            raise HTTPError(404)
+        entry = await self.entry(relpath)
+        cache_headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+        if headers.get("if-none-match") in (entry.etag, "*"):
+            await self.send(writer, 304, b"", extra=cache_headers, keep_alive=keep_alive,
+                            head_only=True)
+            return
+
+        if kind == "nro":
+            body = json.dumps(entry.record, ensure_ascii=False).encode()
+            await self.send(writer, 200, body, "application/json", cache_headers, keep_alive,
+                            head_only)
+        elif kind == "icon":
+            if entry.icon is None:
+                raise HTTPError(404)
+            await self.send(writer, 200, entry.icon, "image/jpeg", cache_headers, keep_alive,
+                            head_only)
+        else:
+            await self.send_romfs(writer, entry, relpath, headers, cache_headers, keep_alive,
+                                  head_only)
+
+    async def send_romfs(self, writer, entry, relpath, headers, extra, keep_alive, head_only):
+        offset, size = entry.romfs
+        if entry.record["error"] or size == 0:
+            raise HTTPError(404)
+
+        status = 200
+        start, end = 0, size
+        byte_range = None
+        if "range" in headers and headers.get("if-range", entry.etag) == entry.etag:
+            byte_range = parse_range(headers["range"], size)
+        if byte_range is not None:
+            status = 206
+            start, end = byte_range
+            extra = dict(extra, **{
+                "Content-Range": "bytes {0}-{1}/{2}".format(start, end - 1, size)
+            })
+
+        extra = dict(extra, **{"Accept-Ranges": "bytes"})
+        writer.write(self.head(status, end - start, "application/octet-stream", extra, keep_alive))
+        if head_only:
+            await writer.drain()
+            return
+
+        loop = asyncio.get_running_loop()
+        romfs_file = await loop.run_in_executor(
+            self.executor, lambda: open(self.resolve(relpath), "rb")
+        )
+        try:
+            await writer.drain()
+            await loop.sendfile(writer.transport, romfs_file, offset + start, end - start)
+        finally:
+            romfs_file.close()
+
+    @staticmethod
+    def head(status, length, content_type=None, extra=None, keep_alive=True):
+        lines = [
+            "HTTP/1.1 {0} {1}".format(status, STATUS_TEXT[status]),
+            "Date: " + formatdate(usegmt=True),
+            "Content-Length: {0}".format(length),
+            "Connection: " + ("keep-alive" if keep_alive else "close"),
+        ]
+        if content_type:
+            lines.append("Content-Type: " + content_type)
+        for name, value in (extra or {}).items():
+            lines.append("{0}: {1}".format(name, value))
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    async def send(self, writer, status, body, content_type="text/plain; charset=utf-8",
+                   extra=None, keep_alive=True, head_only=False):
+        writer.write(self.head(
+            status, len(body), content_type if body else None, extra, keep_alive
+        ))
+        if not head_only:
+            writer.write(body)
+        await writer.drain()
+
+    async def serve(self, host="127.0.0.1", port=8080):
+        server = await asyncio.start_server(
+            self.handle, host, port, limit=MAX_HEADER_SIZE, backlog=1024
+        )
+        print("Serving {0} on {1}".format(
+            self.directory, ", ".join(str(s.getsockname()) for s in server.sockets)
+        ), file=sys.stderr)
+        async with server:
+            await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve NRO metadata, icons and RomFS over HTTP.")
+    parser.add_argument("directory", help="NRO library")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to bind (Default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8080, help="Port (Default: 8080)")
+    parser.add_argument("--cache-size", type=int, default=1024, help="NROs kept in memory")
+    parser.add_argument("--workers", type=int, help="Number of threads for file access")
+    args = parser.parse_args(argv)
+
+    server = NROServer(args.directory, args.cache_size, args.workers)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import shutil
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from nrohelper import IO_WORKERS, NROHelper, ASSET_NAMES, atomic_write, hash_range
+from nroscan import expand_paths
+
+STORE_ALGORITHM = "sha256"
+EXTRACT_NAMES = {"icon": "icon.jpg", "nacp": "control.nacp", "romfs": "romfs.romfs"}
+
+
+class ContentStore:
+    """Content-addressed store for extracted icons, NACPs and RomFS images.
+
+    Every section is stored once as blobs/<xx>/<sha256>, NROs are described by JSON manifests
+    referencing those blobs.
+
+    Args:
+        directory (str): Root directory of the store, created if necessary
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.blob_directory = os.path.join(directory, "blobs")
+        self.manifest_directory = os.path.join(directory, "manifests")
+        os.makedirs(self.blob_directory, exist_ok=True)
+        os.makedirs(self.manifest_directory, exist_ok=True)
+
+    def blob_path(self, digest):
+        return os.path.join(self.blob_directory, digest[:2], digest)
+
+    def add_section(self, nro, name):
+        """Adds an asset section of an opened NROHelper to the store.
+
+        The section is hashed first and only copied if the blob does not exist yet. Copies
+        go through copy_range, which lets the kernel reflink on filesystems supporting it.
+
+        Returns (digest, written).
+
+        Args:
+            nro (NROHelper): NRO to read from
+            name (str): "icon", "nacp" or "romfs"
+        """
+        section = getattr(nro.asset, name)
+        digest = hash_range(
+            nro.fp, nro.nro.header.size + section.offset, section.size, STORE_ALGORITHM
+        )
+        path = self.blob_path(digest)
+        if os.path.exists(path):
+            return digest, False
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with atomic_write(path) as blob_file:
+            nro.stream_asset(section, blob_file)
+        return digest, True
+
+    def export(self, path, manifest_name=None, root=None):
+        """Exports icon, NACP and RomFS of an NRO into the store and writes its manifest.
+
+        Returns the manifest as dict. The number of newly written blobs is stored under
+        "written".
+
+        Args:
+            path (str): Path to the NRO file
+            manifest_name (str): Relative manifest path (Default: path relative to root +
+                ".json")
+            root (str): Directory manifest names are relative to, NROs with the same file
+                name need a common root to not overwrite each other (Default: directory of
+                path)
+        """
+        if manifest_name is None:
+            path_root = os.path.abspath(root or os.path.dirname(os.path.abspath(path)))
+            manifest_name = os.path.relpath(os.path.abspath(path), path_root) + ".json"
+            if manifest_name.startswith(os.pardir + os.sep):
+                raise ValueError("{0} is not below {1}".format(path, root))
+
+        nro = NROHelper(path, lazy=True, read_only=True)
+        try:
+            manifest = {
+                "source": path,
+                "name": nro.get_name(),
+                "publisher": nro.get_publisher(),
+                "version": nro.nacp.get_version(),
+                "build_id": bytes(nro.nro.header.build_id).hex(),
+                "sections": {},
+            }
+            written = 0
+            for name in ASSET_NAMES:
+                size = getattr(nro.asset, name).size
+                if size == 0:
+                    manifest["sections"][name] = None
+                    continue
+                digest, new = self.add_section(nro, name)
+                written += new
+                manifest["sections"][name] = {STORE_ALGORITHM: digest, "size": size}
+        finally:
+            nro.close()
+
+        manifest_path = os.path.join(self.manifest_directory, manifest_name)
+        os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+        with open(manifest_path, "w", encoding="utf-8") as manifest_file:
+            json.dump(manifest, manifest_file, ensure_ascii=False, indent=2)
+
+        manifest["written"] = written
+        return manifest
+
+    def checkout(self, manifest_path, directory):
+        """Materializes the sections of a manifest in directory.
+
+        Files are hardlinked to the blobs where possible and copied otherwise, so they must
+        not be modified in place.
+
+        Args:
+            manifest_path (str): Path to the manifest
+            directory (str): Output directory
+        """
+        with open(manifest_path, encoding="utf-8") as manifest_file:
+            manifest = json.load(manifest_file)
+
+        os.makedirs(directory, exist_ok=True)
+        for name, section in manifest["sections"].items():
+            if section is None:
+                continue
+            blob = self.blob_path(section[STORE_ALGORITHM])
+            target = os.path.join(directory, EXTRACT_NAMES[name])
+            if os.path.lexists(target):
+                os.unlink(target)
+            try:
+                os.link(blob, target)
+            except OSError:
+                shutil.copyfile(blob, target)
+
+
+def export_library(paths, store, workers=None):
+    """Exports many NROs into a store in a thread pool and yields their manifests.
+
+    Manifests are named after the NRO paths relative to the deepest directory containing all
+    of them, so NROs with the same file name in different directories get their own manifest.
+
+    Args:
+        paths (list): NRO files or directories
+        store (ContentStore): Target store
+        workers (int): Number of threads (Default: 2 * CPU count)
+    """
+    paths = list(paths)
+    if not paths:
+        return
+    root = os.path.commonpath([
+        os.path.abspath(path if os.path.isdir(path) else os.path.dirname(path) or os.curdir)
+        for path in paths
+    ])
+
+    def export(path):
+        try:
+            return store.export(path, root=root)
+        except Exception as e:
+            return {"source": path, "error": str(e)}
+
+    with ThreadPoolExecutor(max_workers=workers or IO_WORKERS) as executor:
+        yield from executor.map(export, expand_paths(paths))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Deduplicated export of NRO icons, NACPs and RomFS images."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Export NROs into the store")
+    export_parser.add_argument("store", help="Store directory")
+    export_parser.add_argument("paths", nargs="+", help="NRO files or directories")
+    export_parser.add_argument("--workers", type=int, help="Number of threads")
+
+    checkout_parser = subparsers.add_parser("checkout", help="Materialize a manifest")
+    checkout_parser.add_argument("store", help="Store directory")
+    checkout_parser.add_argument("manifest", help="Manifest file")
+    checkout_parser.add_argument("directory", help="Output directory")
+
+    args = parser.parse_args(argv)
+    store = ContentStore(args.store)
+
+    if args.command == "export":
+        exported = written = 0
+        for manifest in export_library(args.paths, store, args.workers):
+            if "error" in manifest:
+                print("{0}: {1}".format(manifest["source"], manifest["error"]), file=sys.stderr)
+                continue
+            exported += 1
+            written += manifest["written"]
+        print("Exported {0} NROs, wrote {1} new blobs".format(exported, written))
+    else:
+        store.checkout(args.manifest, args.directory)
+
+
+if __name__ == "__main__":
+    main()
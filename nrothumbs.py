@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+from nrohelper import atomic_write, file_identity, pread, read_headers
+
+THUMBNAIL_SIZES = (64, 256)
+THUMBNAIL_QUALITY = 90
+
+
+def default_cache_dir():
+    """Returns the per-user cache directory of NROHelper."""
+    base = (
+        os.environ.get("LOCALAPPDATA")
+        or os.environ.get("XDG_CACHE_HOME")
+        or os.path.join(os.path.expanduser("~"), ".cache")
+    )
+    return os.path.join(base, "NROHelper")
+
+
+def read_icon(path):
+    """Reads only the icon of an NRO, returns None if it has none."""
+    with open(path, "rb", buffering=0) as fp:
+        try:
+            nro, asset = read_headers(fp)
+        except ValueError:
+            return None
+        if asset is None or asset.icon.size == 0:
+            return None
+        return pread(fp, asset.icon.size, nro.header.size + asset.icon.offset)
+
+
+def decode_icon(data, size):
+    """Decodes an icon into a size x size RGB image.
+
+    JPEGs are decoded at the smallest DCT scale which is still at least size pixels wide,
+    so small thumbnails don't pay for a full decode.
+    """
+    image = Image.open(io.BytesIO(data))
+    image.draft("RGB", (size, size))
+    image = image.convert("RGB")
+    if image.size != (size, size):
+        image = image.resize((size, size), Image.LANCZOS)
+    return image
+
+
+class ThumbnailCache:
+    """Thread-safe icon thumbnail cache.
+
+    Decoded thumbnails are kept in a bounded LRU and, if directory is set, stored as JPEGs
+    on disk keyed on file_identity(), so they survive restarts and are invalidated when the
+    NRO changes.
+
+    Args:
+        directory (str): Directory of the disk cache (Default: memory only)
+        capacity (int): Maximum number of thumbnails in memory (Default: 512)
+    """
+
+    def __init__(self, directory=None, capacity=512):
+        self.directory = directory
+        self.capacity = capacity
+        self._images = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _disk_path(self, identity, size):
+        key = hashlib.sha1(repr(identity).encode("utf-8", "surrogateescape")).hexdigest()
+        return os.path.join(self.directory, str(size), key[:2], key + ".jpg")
+
+    def _load(self, identity, size):
+        if self.directory is not None:
+            try:
+                image = Image.open(self._disk_path(identity, size))
+                image.load()
+                self.disk_hits += 1
+                return image
+            except OSError:
+                pass
+
+        icon = read_icon(identity[0])
+        if icon is None:
+            return None
+        image = decode_icon(icon, size)
+        self.misses += 1
+
+        if self.directory is not None:
+            path = self._disk_path(identity, size)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # The disk cache is rebuilt from the NROs, so it's not worth an fsync
+                with atomic_write(path, sync=False) as thumb_file:
+                    image.save(thumb_file, format="JPEG", quality=THUMBNAIL_QUALITY)
+            except OSError:
+                pass
+        return image
+
+    def get(self, path, size=64, stat=None):
+        """Returns the thumbnail of an NRO as PIL image, None if it has no icon.
+
+        Args:
+            path (str): Path to the NRO file
+            size (int): Edge length in pixels, e.g. one of THUMBNAIL_SIZES (Default: 64)
+            stat (os.stat_result): Stat of path if already known, saves a syscall
+        """
+        key = (file_identity(path, stat), size)
+        with self._lock:
+            image = self._images.get(key)
+            if image is not None:
+                self._images.move_to_end(key)
+                self.hits += 1
+                return image
+
+        image = self._load(*key)
+        if image is None:
+            return None
+        with self._lock:
+            self._images[key] = image
+            while len(self._images) > self.capacity:
+                self._images.popitem(last=False)
+        return image
+
+    def clear(self):
+        """Empties the memory LRU, the disk cache is kept."""
+        with self._lock:
+            self._images.clear()
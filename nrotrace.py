@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+
+import bisect
+import time
+
+# Upper bounds of the histogram buckets: 1 µs, 2 µs, 4 µs, ... ~8.4 s, everything above
+# lands in the last bucket
+HISTOGRAM_BOUNDS = [1e-6 * 2 ** i for i in range(24)]
+
+
+class Histogram:
+    """Mergeable timing histogram with power-of-two buckets."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.buckets = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+        self.buckets[bisect.bisect_left(HISTOGRAM_BOUNDS, seconds)] += 1
+
+    def merge(self, other):
+        if not other["count"]:
+            return
+        self.count += other["count"]
+        self.total += other["total"]
+        self.min = other["min"] if self.min is None else min(self.min, other["min"])
+        self.max = other["max"] if self.max is None else max(self.max, other["max"])
+        self.buckets = [a + b for a, b in zip(self.buckets, other["buckets"])]
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "total": self.total,
+            "min": self.min,
+            "max": self.max,
+            "buckets": self.buckets,
+        }
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "start")
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.tracer.record(self.name, time.perf_counter() - self.start)
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class Tracer:
+    """Collects per-operation timings and I/O call counts.
+
+    Timings are aggregated into histograms right away, so memory use doesn't grow with the
+    number of files. Tracers can be shared between threads; for process pools, ship state()
+    back to the parent and merge() it there.
+
+    Args:
+        callback (callable): Called with (operation, seconds) after every traced operation
+    """
+    enabled = True
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.histograms = {}
+        self.io = {}
+        # Imported here, nrohelper imports this module on every start of the CLI
+        import threading
+
+        self._lock = threading.Lock()
+
+    def span(self, name):
+        """Returns a context manager timing the operation name."""
+        return _Span(self, name)
+
+    def record(self, name, seconds):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.add(seconds)
+        if self.callback is not None:
+            self.callback(name, seconds)
+
+    def count_io(self, operation, size=0):
+        """Counts an I/O call (e.g. "read", "seek", "pwrite") transferring size bytes."""
+        with self._lock:
+            calls, total = self.io.get(operation, (0, 0))
+            self.io[operation] = (calls + 1, total + size)
+
+    def wrap(self, fp):
+        """Wraps a file object so its I/O calls are counted."""
+        return TracedFile(fp, self)
+
+    def state(self):
+        """Returns the aggregated state as a plain (picklable, JSON-serializable) dict."""
+        with self._lock:
+            return {
+                "operations": {
+                    name: histogram.to_dict() for name, histogram in self.histograms.items()
+                },
+                "io": {
+                    operation: {"calls": calls, "bytes": size}
+                    for operation, (calls, size) in self.io.items()
+                },
+            }
+
+    def merge(self, state):
+        """Merges a state() of another tracer, e.g. from a worker process."""
+        with self._lock:
+            for name, other in state["operations"].items():
+                histogram = self.histograms.get(name)
+                if histogram is None:
+                    histogram = self.histograms[name] = Histogram()
+                histogram.merge(other)
+            for operation, other in state["io"].items():
+                calls, size = self.io.get(operation, (0, 0))
+                self.io[operation] = (calls + other["calls"], size + other["bytes"])
+
+    def export(self, path):
+        """Writes the aggregated histograms and I/O counters as JSON."""
+        import json
+
+        report = self.state()
+        report["bucket_bounds"] = HISTOGRAM_BOUNDS
+        with open(path, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+
+
+class NullTracer:
+    """Disabled tracer, every method is a no-op."""
+    enabled = False
+    _span = _NullSpan()
+
+    def span(self, name):
+        return self._span
+
+    def record(self, name, seconds):
+        pass
+
+    def count_io(self, operation, size=0):
+        pass
+
+    def wrap(self, fp):
+        return fp
+
+
+NULL_TRACER = NullTracer()
+
+
+class TracedFile:
+    """File object proxy counting read/write/seek calls and transferred bytes.
+
+    nrohelper's pread/pwrite/copy_range recognize it and count positional I/O as well.
+
+    Args:
+        fp (file): Wrapped file object
+        tracer (Tracer): Tracer to report to
+    """
+
+    def __init__(self, fp, tracer):
+        self.raw = fp
+        self.tracer = tracer
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        self.tracer.count_io("read", len(data))
+        return data
+
+    def readinto(self, buffer):
+        size = self.raw.readinto(buffer)
+        self.tracer.count_io("read", size or 0)
+        return size
+
+    def write(self, data):
+        size = self.raw.write(data)
+        self.tracer.count_io("write", len(data))
+        return size
+
+    def seek(self, offset, whence=0):
+        self.tracer.count_io("seek")
+        return self.raw.seek(offset, whence)
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
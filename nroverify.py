@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from nrohelper import validate
+from nroscan import expand_paths
+
+
+def verify_file(path, full=False):
+    """Validates a single NRO and returns its status record.
+
+    status is "ok", "invalid" (problems lists what is wrong) or "error" if the file could
+    not be read.
+
+    Args:
+        path (str): Path to the NRO file
+        full (bool): Also check section contents, see nrohelper.validate (Default: False)
+    """
+    record = {"path": path, "status": "ok", "problems": []}
+    try:
+        record["problems"] = validate(path, full)
+    except (OSError, EOFError) as e:
+        record["status"] = "error"
+        record["problems"] = [str(e)]
+        return record
+    if record["problems"]:
+        record["status"] = "invalid"
+    return record
+
+
+def verify_files(paths, full=False, workers=None, chunksize=64):
+    """Validates many NROs in a process pool and yields their status records in order.
+
+    Args:
+        paths (iterable): NRO paths
+        full (bool): Also check section contents (Default: False)
+        workers (int): Number of worker processes (Default: CPU count)
+        chunksize (int): Number of paths handed to a worker at once (Default: 64)
+    """
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(partial(verify_file, full=full), paths, chunksize=chunksize)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Validate NRO headers (and optionally contents) across a library."
+    )
+    parser.add_argument("paths", nargs="+", help="NRO files or directories")
+    parser.add_argument(
+        "--full", action="store_true",
+        help="Also check NACP, icon, RomFS header and build ID (reads the segments)",
+    )
+    parser.add_argument("--workers", type=int, help="Number of worker processes")
+    parser.add_argument("--quiet", action="store_true", help="Only report files which failed")
+    args = parser.parse_args(argv)
+
+    counts = {"ok": 0, "invalid": 0, "error": 0}
+    for record in verify_files(expand_paths(args.paths), args.full, args.workers):
+        counts[record["status"]] += 1
+        if not args.quiet or record["status"] != "ok":
+            print(json.dumps(record, ensure_ascii=False))
+    sys.stdout.flush()
+    print("{ok} ok, {invalid} invalid, {error} errors".format(**counts), file=sys.stderr)
+    return 0 if counts["ok"] == sum(counts.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,503 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import posixpath
+from collections import namedtuple
+from ctypes import *
+
+from nrohelper import copy_range, pread
+
+ROMFS_ENTRY_EMPTY = 0xFFFFFFFF
+
+
+class RomFSHeader(LittleEndianStructure):
+    """https://switchbrew.org/wiki/RomFS#Header"""
+    _pack_ = 1
+    _fields_ = [
+        ("headerSize", c_uint64),
+        ("dirHashTableOffset", c_uint64),
+        ("dirHashTableSize", c_uint64),
+        ("dirMetaTableOffset", c_uint64),
+        ("dirMetaTableSize", c_uint64),
+        ("fileHashTableOffset", c_uint64),
+        ("fileHashTableSize", c_uint64),
+        ("fileMetaTableOffset", c_uint64),
+        ("fileMetaTableSize", c_uint64),
+        ("dataOffset", c_uint64)
+    ]
+
+
+class RomFSDirectoryEntry(LittleEndianStructure):
+    """https://switchbrew.org/wiki/RomFS#Directory_Metadata_Structure (without name)"""
+    _pack_ = 1
+    _fields_ = [
+        ("parent", c_uint32),
+        ("sibling", c_uint32),
+        ("childDir", c_uint32),
+        ("childFile", c_uint32),
+        ("hash", c_uint32),
+        ("nameSize", c_uint32)
+    ]
+
+
+class RomFSFileEntry(LittleEndianStructure):
+    """https://switchbrew.org/wiki/RomFS#File_Metadata_Structure (without name)"""
+    _pack_ = 1
+    _fields_ = [
+        ("parent", c_uint32),
+        ("sibling", c_uint32),
+        ("offset", c_uint64),
+        ("size", c_uint64),
+        ("hash", c_uint32),
+        ("nameSize", c_uint32)
+    ]
+
+
+RomFSStat = namedtuple("RomFSStat", ["offset", "size"])
+
+
+class RomFSFile(io.RawIOBase):
+    """Read-only, seekable view of one file in a RomFS, returned by RomFS.open().
+
+    Reads go through pread and copy_to() through copy_range, so the file is never loaded as
+    a whole and several readers can share one source.
+
+    Args:
+        source (file or buffer): File object or bytes-like object containing the RomFS
+        offset (int): Absolute offset of the file in source
+        size (int): Size of the file
+    """
+
+    def __init__(self, source, offset, size):
+        super().__init__()
+        self.source = source
+        self.offset = offset
+        self.size = size
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = max(0, min(len(buffer), self.size - self._position))
+        if size == 0:
+            return 0
+        start = self.offset + self._position
+        if hasattr(self.source, "read"):
+            data = pread(self.source, size, start)
+        else:
+            data = memoryview(self.source)[start:start + size]
+        if len(data) != size:
+            raise EOFError("RomFS is truncated")
+        buffer[:size] = data
+        self._position += size
+        return size
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._position
+        elif whence == os.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError("Negative seek position {0}".format(offset))
+        self._position = offset
+        return offset
+
+    def tell(self):
+        return self._position
+
+    def copy_to(self, dst):
+        """Copies the rest of the file from the current position to dst.
+
+        Args:
+            dst (file): Destination file object
+        """
+        size = max(0, self.size - self._position)
+        start = self.offset + self._position
+        if hasattr(self.source, "read"):
+            copy_range(self.source, start, size, dst)
+        else:
+            dst.write(memoryview(self.source)[start:start + size])
+        self._position += size
+
+
+def calc_path_hash(parent, name):
+    """Calculates the hash table hash of an entry.
+
+    Args:
+        parent (int): Offset of the parent directory entry
+        name (bytes): Encoded entry name
+    """
+    value = parent ^ 123456789
+    for char in name:
+        value = ((value >> 5) | (value << 27)) & 0xFFFFFFFF
+        value ^= char
+    return value
+
+
+class RomFS:
+    """Indexed, read-only access to a RomFS image.
+
+    Only the header, hash tables and metadata tables are read, file contents are read on
+    demand. Works on files (e.g. an NRO with a RomFS at offset) and on buffers like mmaps.
+
+    Args:
+        source (file or buffer): File object or bytes-like object containing the RomFS
+        offset (int): Offset of the RomFS in source (Default: 0)
+    """
+
+    def __init__(self, source, offset=0):
+        self.source = source
+        self.offset = offset
+
+        self.header = RomFSHeader.from_buffer_copy(self._read(0, sizeof(RomFSHeader)))
+        if self.header.headerSize != sizeof(RomFSHeader):
+            raise Exception("RomFS header size is wrong, should be 0x50")
+
+        self.dir_hash_table = self._read_table(
+            self.header.dirHashTableOffset, self.header.dirHashTableSize
+        )
+        self.dir_meta_table = self._read(
+            self.header.dirMetaTableOffset, self.header.dirMetaTableSize
+        )
+        self.file_hash_table = self._read_table(
+            self.header.fileHashTableOffset, self.header.fileHashTableSize
+        )
+        self.file_meta_table = self._read(
+            self.header.fileMetaTableOffset, self.header.fileMetaTableSize
+        )
+
+    def _read(self, offset, size):
+        if hasattr(self.source, "read"):
+            data = pread(self.source, size, self.offset + offset)
+        else:
+            data = bytes(self.source[self.offset + offset:self.offset + offset + size])
+        if len(data) != size:
+            raise EOFError("RomFS is truncated")
+        return data
+
+    def _read_table(self, offset, size):
+        return (c_uint32 * (size // 4)).from_buffer_copy(self._read(offset, size))
+
+    def _dir_entry(self, entry_offset):
+        entry = RomFSDirectoryEntry.from_buffer_copy(self.dir_meta_table, entry_offset)
+        start = entry_offset + sizeof(RomFSDirectoryEntry)
+        return entry, self.dir_meta_table[start:start + entry.nameSize]
+
+    def _file_entry(self, entry_offset):
+        entry = RomFSFileEntry.from_buffer_copy(self.file_meta_table, entry_offset)
+        start = entry_offset + sizeof(RomFSFileEntry)
+        return entry, self.file_meta_table[start:start + entry.nameSize]
+
+    def _lookup(self, hash_table, get_entry, parent, name):
+        if not hash_table:
+            return None
+        entry_offset = hash_table[calc_path_hash(parent, name) % len(hash_table)]
+        while entry_offset != ROMFS_ENTRY_EMPTY:
+            entry, entry_name = get_entry(entry_offset)
+            if entry.parent == parent and entry_name == name:
+                return entry_offset
+            entry_offset = entry.hash
+        return None
+
+    def _resolve_dir(self, parts):
+        dir_offset = 0
+        for part in parts:
+            dir_offset = self._lookup(self.dir_hash_table, self._dir_entry, dir_offset, part)
+            if dir_offset is None:
+                return None
+        return dir_offset
+
+    @staticmethod
+    def _split(path):
+        return [part.encode("utf-8") for part in path.strip("/").split("/") if part]
+
+    def get_file(self, path):
+        """Returns the file entry for path. Raises FileNotFoundError if it doesn't exist."""
+        parts = self._split(path)
+        if parts:
+            dir_offset = self._resolve_dir(parts[:-1])
+            if dir_offset is not None:
+                file_offset = self._lookup(
+                    self.file_hash_table, self._file_entry, dir_offset, parts[-1]
+                )
+                if file_offset is not None:
+                    return self._file_entry(file_offset)[0]
+        raise FileNotFoundError("File not found in RomFS: {0}".format(path))
+
+    def exists(self, path):
+        """Returns True if path is a file or directory in the RomFS."""
+        try:
+            self.get_file(path)
+            return True
+        except FileNotFoundError:
+            return self._resolve_dir(self._split(path)) is not None
+
+    def listdir(self, path="/"):
+        """Returns the names of all directories and files in path."""
+        dir_offset = self._resolve_dir(self._split(path))
+        if dir_offset is None:
+            raise FileNotFoundError("Directory not found in RomFS: {0}".format(path))
+        dirs, files = self._children(dir_offset)
+        return [name for name, _ in dirs] + [name for name, _ in files]
+
+    def _children(self, dir_offset):
+        directory, _ = self._dir_entry(dir_offset)
+
+        dirs = []
+        child = directory.childDir
+        while child != ROMFS_ENTRY_EMPTY:
+            entry, name = self._dir_entry(child)
+            dirs.append((name.decode("utf-8"), child))
+            child = entry.sibling
+
+        files = []
+        child = directory.childFile
+        while child != ROMFS_ENTRY_EMPTY:
+            entry, name = self._file_entry(child)
+            files.append((name.decode("utf-8"), entry))
+            child = entry.sibling
+
+        return dirs, files
+
+    def walk(self):
+        """Yields (path, file entry) for every file in the RomFS."""
+        stack = [("/", 0)]
+        while stack:
+            path, dir_offset = stack.pop()
+            dirs, files = self._children(dir_offset)
+            for name, entry in files:
+                yield posixpath.join(path, name), entry
+            for name, child in reversed(dirs):
+                stack.append((posixpath.join(path, name), child))
+
+    def stat(self, path):
+        """Returns RomFSStat(offset, size) of a single file, offset is absolute in source."""
+        entry = self.get_file(path)
+        return RomFSStat(self.offset + self.header.dataOffset + entry.offset, entry.size)
+
+    def open(self, path):
+        """Returns a seekable RomFSFile for reading a single file in parts."""
+        return RomFSFile(self.source, *self.stat(path))
+
+    def read(self, path):
+        """Returns the contents of a single file. Use open() for large files."""
+        entry = self.get_file(path)
+        return self._read(self.header.dataOffset + entry.offset, entry.size)
+
+    def extract(self, path, name):
+        """Extracts a single file to name (path or file object) without reading the others."""
+        with self.open(path) as romfs_file:
+            if hasattr(name, "write"):
+                romfs_file.copy_to(name)
+            else:
+                with open(name, "wb") as out_file:
+                    romfs_file.copy_to(out_file)
+
+    def extract_all(self, directory):
+        """Extracts all files to directory."""
+        for path, entry in self.walk():
+            target = os.path.join(directory, *path.strip("/").split("/"))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            start = self.offset + self.header.dataOffset + entry.offset
+            with RomFSFile(self.source, start, entry.size) as romfs_file:
+                with open(target, "wb") as out_file:
+                    romfs_file.copy_to(out_file)
+
+
+ROMFS_DATA_OFFSET = 0x200
+ROMFS_FILE_ALIGNMENT = 0x10
+
+
+def hash_table_size(entries):
+    """Returns the hash table bucket count Nintendo's tools use for a number of entries."""
+    if entries < 3:
+        return 3
+    if entries < 19:
+        return entries | 1
+    while any(entries % prime == 0 for prime in (2, 3, 5, 7, 11, 13, 17)):
+        entries += 1
+    return entries
+
+
+def _align(value, alignment):
+    return (value + alignment - 1) & ~(alignment - 1)
+
+
+class RomFSBuilder:
+    """Packs a directory tree into a RomFS image.
+
+    The layout (header, metadata and hash tables) is planned from directory listings and file
+    sizes only, so size is known before anything is written. write() then streams the image
+    front to back - header, file contents one at a time, tables - which also works for pipes.
+
+    Args:
+        directory (str): Root directory of the RomFS
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        # [name, parent index, child dir indices, child file indices]
+        self._dirs = []
+        # (name, parent dir index, path, size)
+        self._files = []
+        self._scan(directory, b"", 0)
+        self._plan()
+
+    def _scan(self, path, name, parent):
+        index = len(self._dirs)
+        self._dirs.append([name, parent, [], []])
+        with os.scandir(path) as entries:
+            entries = sorted(entries, key=lambda entry: entry.name)
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                self._dirs[index][2].append(self._scan(entry.path, entry.name.encode(), index))
+            elif entry.is_file():
+                self._dirs[index][3].append(len(self._files))
+                self._files.append(
+                    (entry.name.encode(), index, entry.path, entry.stat().st_size)
+                )
+        return index
+
+    def _plan(self):
+        dir_offsets = []
+        offset = 0
+        for name, _, _, _ in self._dirs:
+            dir_offsets.append(offset)
+            offset += _align(sizeof(RomFSDirectoryEntry) + len(name), 4)
+        dir_meta_size = offset
+
+        file_offsets = []
+        offset = 0
+        for name, _, _, _ in self._files:
+            file_offsets.append(offset)
+            offset += _align(sizeof(RomFSFileEntry) + len(name), 4)
+        file_meta_size = offset
+
+        # Hash chains: each entry is hashed exactly once and pushed in front of its bucket
+        dir_hash_table = [ROMFS_ENTRY_EMPTY] * hash_table_size(len(self._dirs))
+        dir_next = []
+        for (name, parent, _, _), entry_offset in zip(self._dirs, dir_offsets):
+            bucket = calc_path_hash(dir_offsets[parent], name) % len(dir_hash_table)
+            dir_next.append(dir_hash_table[bucket])
+            dir_hash_table[bucket] = entry_offset
+
+        file_hash_table = [ROMFS_ENTRY_EMPTY] * hash_table_size(len(self._files))
+        file_next = []
+        for (name, parent, _, _), entry_offset in zip(self._files, file_offsets):
+            bucket = calc_path_hash(dir_offsets[parent], name) % len(file_hash_table)
+            file_next.append(file_hash_table[bucket])
+            file_hash_table[bucket] = entry_offset
+
+        # File data in file entry order, each aligned to 0x10
+        self._data_offsets = []
+        offset = 0
+        for _, _, _, size in self._files:
+            offset = _align(offset, ROMFS_FILE_ALIGNMENT)
+            self._data_offsets.append(offset)
+            offset += size
+        data_size = offset
+
+        dir_siblings = [ROMFS_ENTRY_EMPTY] * len(self._dirs)
+        file_siblings = [ROMFS_ENTRY_EMPTY] * len(self._files)
+        for _, _, child_dirs, child_files in self._dirs:
+            for child, next_child in zip(child_dirs, child_dirs[1:]):
+                dir_siblings[child] = dir_offsets[next_child]
+            for child, next_child in zip(child_files, child_files[1:]):
+                file_siblings[child] = file_offsets[next_child]
+
+        dir_meta = bytearray()
+        for index, (name, parent, child_dirs, child_files) in enumerate(self._dirs):
+            entry = RomFSDirectoryEntry(
+                dir_offsets[parent],
+                dir_siblings[index],
+                dir_offsets[child_dirs[0]] if child_dirs else ROMFS_ENTRY_EMPTY,
+                file_offsets[child_files[0]] if child_files else ROMFS_ENTRY_EMPTY,
+                dir_next[index],
+                len(name),
+            )
+            dir_meta += bytes(entry) + name
+            dir_meta += b"\x00" * (_align(len(dir_meta), 4) - len(dir_meta))
+
+        file_meta = bytearray()
+        for index, (name, parent, _, size) in enumerate(self._files):
+            entry = RomFSFileEntry(
+                dir_offsets[parent],
+                file_siblings[index],
+                self._data_offsets[index],
+                size,
+                file_next[index],
+                len(name),
+            )
+            file_meta += bytes(entry) + name
+            file_meta += b"\x00" * (_align(len(file_meta), 4) - len(file_meta))
+
+        header = RomFSHeader()
+        header.headerSize = sizeof(RomFSHeader)
+        header.dataOffset = ROMFS_DATA_OFFSET
+        header.dirHashTableOffset = _align(ROMFS_DATA_OFFSET + data_size, 4)
+        header.dirHashTableSize = 4 * len(dir_hash_table)
+        header.dirMetaTableOffset = header.dirHashTableOffset + header.dirHashTableSize
+        header.dirMetaTableSize = dir_meta_size
+        header.fileHashTableOffset = header.dirMetaTableOffset + dir_meta_size
+        header.fileHashTableSize = 4 * len(file_hash_table)
+        header.fileMetaTableOffset = header.fileHashTableOffset + header.fileHashTableSize
+        header.fileMetaTableSize = file_meta_size
+
+        self.header = header
+        self._data_size = data_size
+        self._tables = b"".join((
+            bytes((c_uint32 * len(dir_hash_table))(*dir_hash_table)),
+            dir_meta,
+            bytes((c_uint32 * len(file_hash_table))(*file_hash_table)),
+            file_meta,
+        ))
+        self.size = header.fileMetaTableOffset + file_meta_size
+
+    def write(self, dst, progress=None, cancel=None):
+        """Streams the image to dst, file contents are copied one file at a time.
+
+        Args:
+            dst (file): Destination file object, doesn't need to be seekable
+            progress (callable): Called with the number of bytes written so far
+            cancel (threading.Event): Raises nrohelper.Cancelled once set
+        """
+        written = 0
+
+        def put(data):
+            nonlocal written
+            dst.write(data)
+            written += len(data)
+
+        put(bytes(self.header))
+        put(b"\x00" * (ROMFS_DATA_OFFSET - sizeof(RomFSHeader)))
+        for (_, _, path, size), data_offset in zip(self._files, self._data_offsets):
+            put(b"\x00" * (ROMFS_DATA_OFFSET + data_offset - written))
+            with open(path, "rb") as src_file:
+                if os.fstat(src_file.fileno()).st_size != size:
+                    raise RuntimeError("File changed while building the RomFS: " + path)
+                copy_range(
+                    src_file, 0, size, dst,
+                    progress=None if progress is None else lambda done: progress(written + done),
+                    cancel=cancel,
+                )
+            written += size
+        put(b"\x00" * (self.header.dirHashTableOffset - written))
+        put(self._tables)
+        if progress is not None:
+            progress(written)
+
+
+def build_romfs(directory, name):
+    """Packs directory into a RomFS image at name (path or file object). Returns its size."""
+    builder = RomFSBuilder(directory)
+    if hasattr(name, "write"):
+        builder.write(name)
+    else:
+        with open(name, "wb") as out_file:
+            builder.write(out_file)
+    return builder.size
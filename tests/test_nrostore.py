@@ -0,0 +1,52 @@
+import json
+import os
+
+from nrobench import make_nro
+from nrostore import ContentStore, export_library
+
+
+def make_library(tmp_path):
+    paths = []
+    for folder, name in (("a", "First"), ("b", "Second")):
+        os.makedirs(tmp_path / folder)
+        path = str(tmp_path / folder / "hbmenu.nro")
+        make_nro(path, romfs_size=0x1000, name=name)
+        paths.append(path)
+    return paths
+
+
+def read_manifests(store):
+    manifests = {}
+    for directory, _, files in os.walk(store.manifest_directory):
+        for name in files:
+            path = os.path.join(directory, name)
+            with open(path, encoding="utf-8") as manifest_file:
+                manifests[os.path.relpath(path, store.manifest_directory)] = json.load(
+                    manifest_file
+                )
+    return manifests
+
+
+def test_same_file_names_get_their_own_manifests(tmp_path):
+    paths = make_library(tmp_path)
+    store = ContentStore(str(tmp_path / "store"))
+
+    results = list(export_library(paths, store))
+
+    assert all("error" not in result for result in results)
+    manifests = read_manifests(store)
+    assert sorted(manifests) == [
+        os.path.join("a", "hbmenu.nro.json"), os.path.join("b", "hbmenu.nro.json")
+    ]
+    assert {manifest["source"]: manifest["name"] for manifest in manifests.values()} == {
+        paths[0]: "First", paths[1]: "Second"
+    }
+
+
+def test_same_file_names_in_separate_directories(tmp_path):
+    make_library(tmp_path)
+    store = ContentStore(str(tmp_path / "store"))
+
+    list(export_library([str(tmp_path / "a"), str(tmp_path / "b")], store))
+
+    assert len(read_manifests(store)) == 2